@@ -1,126 +1,165 @@
 import random
 from math import exp, sqrt
 
+import numpy as np
+
 from gdpc import Editor, Block, geometry, Transform
 
 from HouseOptimizied import *
 from networks.geometry.Point3D import Point3D
 from networks.roads_2.Road import Road
-from world_maker.data_analysis import transpose_form_heightmap
+from world_maker.data_analysis import transpose_form_heightmap_array, handle_import_array
+from world_maker.MapRegistry import maps
 from world_maker.District import Road as Road_grid
-from world_maker.Skeleton import Skeleton, simplify_coordinates
+from world_maker.Skeleton import Skeleton, prepare_road
 from world_maker.terraforming import remove_trees, smooth_terrain
 from world_maker.world_maker import world_maker
-from networks.geometry.Point3D import Point3D
 from networks.geometry.Point2D import Point2D
 from networks.geometry.Circle import Circle
 
-from PIL import Image
 from utils.JsonReader import JsonReader
 from utils.YamlReader import YamlReader
+from utils.OfflineServer import OfflineServer
+from utils.EditorLog import EditorLog, RecordingEditor, RECORD_ENV
+from utils.EditorSession import EditorSession, set_session
 from buildings.Building import Building
 
 from utils.functions import *
 from utils.Enums import DIRECTION
+import os
 import time
-
-
-def main():
-    start_time_all = time.time()
-    start_time = time.time()
-    print("Making world...")
-    rectangle_house_mountain, rectangle_building, skeleton_highway, skeleton_mountain, road_grid = world_maker()
-    time_world_maker = time.time() - start_time
-    print(f"[TIME] World_maker {time_world_maker}")
-    editor = Editor(buffering=True)
-    buildArea = editor.getBuildArea()
-    origin = ((buildArea.begin).x, (buildArea.begin).z)
-    center = (abs(buildArea.begin.x - buildArea.end.x) / 2,
-              abs(buildArea.begin.z - buildArea.end.z) / 2)
-    length_world = sqrt((center[0]*2) ** 2 + (center[1]*2) ** 2)
-
-    start_time = time.time()
-    remove_trees('./world_maker/data/heightmap.png', './world_maker/data/treemap.png',
-                 './world_maker/data/smooth_sobel_watermap.png')
-    time_remove_tree = time.time() - start_time
-    print(f"[TIME] Remove tree {time_remove_tree}")
-
-    start_time = time.time()
-    smooth_terrain('./world_maker/data/heightmap.png',
-                   './world_maker/data/heightmap_smooth.png', './world_maker/data/smooth_sobel_watermap.png')
-    time_smooth_terrain = time.time() - start_time
-    print(f"[TIME] Smooth terrain {time_smooth_terrain}")
-
-    start_time = time.time()
-    set_roads(skeleton_highway, origin)
-    set_roads(skeleton_mountain, origin)
-    time_roads = time.time() - start_time
-    print(f"[TIME] Roads {time_roads}")
-    # set_roads_grids(road_grid, origin)
-    # roads.setRoads(skeleton_mountain)
-    # roads.setRoads(skeleton_highway)
-
-    blocks = {
-        "wall": "blackstone",
-        "roof": "blackstone",
-        "roof_slab": "blackstone_slab",
-        "door": "oak_door",
-        "window": "glass_pane",
-        "entrance": "oak_door",
-        "stairs": "quartz_stairs",
-        "stairs_slab": "quartz_slab",
-        "celling": "quartz_block",
-        "floor": "quartz_block",
-        "celling_slab": "quartz_slab",
-        "garden_outline": "oak_leaves",
-        "garden_floor": "grass_block"
-    }
-
-    entranceDirection = ["N", "S", "E", "W"]
-
-    # get every differents buildings shapes
-    f = JsonReader('./buildings/shapes.json')
-    shapes = f.data
-    baseShape = shapes[0]['matrice']
-
-    # get the random data for the buildings
-    y = YamlReader('params.yml')
-    random_data = y.data
-    # create a building at the relative position 0,0 with 20 blocks length and 20 blocks width, with a normal shape and 10 floors
-
-    # build it with your custom materials
-
-    start_time = time.time()
-    for buildings in rectangle_building:
-        height = get_height_building_from_center(
-            center, (buildings[0][0], buildings[0][2]), length_world)
-        start = (min(buildings[0][0], buildings[1][0]) + origin[0], buildings[0]
-                 [1], min(buildings[0][2], buildings[1][2]) + origin[1])
-        end = (max(buildings[0][0], buildings[1][0]) + origin[0],
-               buildings[1]
-               [1]+height, max(buildings[0][2], buildings[1][2]) + origin[1])
-
-        building = Building(random_data["buildings"], [
-            start, end], baseShape, DIRECTION.EAST)
-        building.build(editor, ["stripped_oak_log", "glass_pane", "glass", "cobblestone_wall", "stone_brick_stairs",
-                                "oak_planks", "white_concrete", "cobblestone", "stone_brick_slab", "iron_bars"])
-
-    time_buildings = time.time() - start_time
-    print(f"[TIME] Buildings {time_buildings}")
-
-    start_time = time.time()
-    for buildings in rectangle_house_mountain:
-        start = (buildings[0][0] + origin[0], buildings[0]
-                 [1], buildings[0][2] + origin[1])
-        end = (buildings[1][0] + origin[0], buildings[1]
-               [1], buildings[1][2] + origin[1])
-        house = House(editor, start, end,
-                      entranceDirection[random.randint(0, 3)], blocks)
-        house.build()
-    time_houses = time.time() - start_time
-    print(f"[TIME] Houses {time_houses}")
-
-    print("[GDMC] Done!\n\n")
+from contextlib import nullcontext
+
+
+def main(dump_maps: bool = False):
+    # Stand-in for the game when GDMC_OFFLINE_WORLD is set, see utils/OfflineServer.py.
+    server = OfflineServer.from_environment()
+    # Traffic of the editor, tagged by stage, saved in the GDMC_RECORD file if set, see utils/EditorLog.py.
+    log = EditorLog.from_environment()
+    stage = nullcontext if log is None else log.stage
+    # One editor and one build area request for every stage.
+    session = set_session(EditorSession(None if log is None else RecordingEditor(log, buffering=True)))
+    editor = session.editor
+
+    try:
+        start_time_all = time.time()
+        start_time = time.time()
+        print("Making world...")
+        with stage("world_maker"):
+            rectangle_house_mountain, rectangle_building, skeleton_highway, skeleton_mountain, road_grid = world_maker(
+                session=session)
+        time_world_maker = time.time() - start_time
+        print(f"[TIME] World_maker {time_world_maker}")
+        buildArea = session.build_area
+        origin = ((buildArea.begin).x, (buildArea.begin).z)
+        center = (abs(buildArea.begin.x - buildArea.end.x) / 2,
+                  abs(buildArea.begin.z - buildArea.end.z) / 2)
+        length_world = sqrt((center[0]*2) ** 2 + (center[1]*2) ** 2)
+
+        start_time = time.time()
+        with stage("remove_trees"):
+            remove_trees('./world_maker/data/heightmap.png', './world_maker/data/treemap.png',
+                         './world_maker/data/smooth_sobel_watermap.png', session=session)
+            session.flush()
+        time_remove_tree = time.time() - start_time
+        print(f"[TIME] Remove tree {time_remove_tree}")
+
+        start_time = time.time()
+        with stage("smooth_terrain"):
+            smooth_terrain('./world_maker/data/heightmap.png',
+                           './world_maker/data/heightmap_smooth.png', './world_maker/data/smooth_sobel_watermap.png',
+                           session=session)
+            session.flush()
+        time_smooth_terrain = time.time() - start_time
+        print(f"[TIME] Smooth terrain {time_smooth_terrain}")
+
+        start_time = time.time()
+        with stage("roads"):
+            set_roads(skeleton_highway, origin, editor=editor)
+            set_roads(skeleton_mountain, origin, editor=editor)
+            session.flush()
+        time_roads = time.time() - start_time
+        print(f"[TIME] Roads {time_roads}")
+        # set_roads_grids(road_grid, origin)
+        # roads.setRoads(skeleton_mountain)
+        # roads.setRoads(skeleton_highway)
+
+        blocks = {
+            "wall": "blackstone",
+            "roof": "blackstone",
+            "roof_slab": "blackstone_slab",
+            "door": "oak_door",
+            "window": "glass_pane",
+            "entrance": "oak_door",
+            "stairs": "quartz_stairs",
+            "stairs_slab": "quartz_slab",
+            "celling": "quartz_block",
+            "floor": "quartz_block",
+            "celling_slab": "quartz_slab",
+            "garden_outline": "oak_leaves",
+            "garden_floor": "grass_block"
+        }
+
+        entranceDirection = ["N", "S", "E", "W"]
+
+        # get every differents buildings shapes
+        f = JsonReader('./buildings/shapes.json')
+        shapes = f.data
+        baseShape = shapes[0]['matrice']
+
+        # get the random data for the buildings
+        y = YamlReader('params.yml')
+        random_data = y.data
+        # create a building at the relative position 0,0 with 20 blocks length and 20 blocks width, with a normal shape and 10 floors
+
+        # build it with your custom materials
+
+        start_time = time.time()
+        with stage("buildings"):
+            for buildings in rectangle_building:
+                height = get_height_building_from_center(
+                    center, (buildings[0][0], buildings[0][2]), length_world)
+                start = (min(buildings[0][0], buildings[1][0]) + origin[0], buildings[0]
+                         [1], min(buildings[0][2], buildings[1][2]) + origin[1])
+                end = (max(buildings[0][0], buildings[1][0]) + origin[0],
+                       buildings[1]
+                       [1]+height, max(buildings[0][2], buildings[1][2]) + origin[1])
+
+                building = Building(random_data["buildings"], [
+                    start, end], baseShape, DIRECTION.EAST)
+                building.build(editor, ["stripped_oak_log", "glass_pane", "glass", "cobblestone_wall", "stone_brick_stairs",
+                                        "oak_planks", "white_concrete", "cobblestone", "stone_brick_slab", "iron_bars"])
+            session.flush()
+
+        time_buildings = time.time() - start_time
+        print(f"[TIME] Buildings {time_buildings}")
+
+        start_time = time.time()
+        with stage("houses"):
+            for buildings in rectangle_house_mountain:
+                start = (buildings[0][0] + origin[0], buildings[0]
+                         [1], buildings[0][2] + origin[1])
+                end = (buildings[1][0] + origin[0], buildings[1]
+                       [1], buildings[1][2] + origin[1])
+                house = House(editor, start, end,
+                              entranceDirection[random.randint(0, 3)], blocks)
+                house.build()
+            session.flush()
+        time_houses = time.time() - start_time
+        print(f"[TIME] Houses {time_houses}")
+
+        print("[GDMC] Done!\n\n")
+    finally:
+        # Also on failure: send what is buffered, keep the partial recording and free the port.
+        session.close()
+        if log is not None:
+            log.save(os.environ[RECORD_ENV])
+            print(log.summary())
+        if server is not None:
+            server.stop()
+
+    if dump_maps:
+        maps.dump()
 
     print(f"[TIME] Total {time.time() - start_time_all}")
     print(f"[TIME] World_maker {time_world_maker}")
@@ -139,6 +178,7 @@ def get_height_building_from_center(center, position, length_world):
 
 
 def set_roads_grids(road_grid: Road_grid, origin):
+    heightmap = handle_import_array('./world_maker/data/heightmap.png')
     for i in range(len(road_grid)):
         if road_grid[i].border:
             for j in range(len(road_grid)):
@@ -147,65 +187,33 @@ def set_roads_grids(road_grid: Road_grid, origin):
                     j].position.y) or (
                         road_grid[i].position.x != road_grid[j].position.x and road_grid[i].position.y == road_grid[
                             j].position.y):
-                    point_1 = transpose_form_heightmap(
-                        './world_maker/data/heightmap.png', (road_grid[i].position.x, road_grid[i].position.y), origin)
-                    point_2 = transpose_form_heightmap(
-                        './world_maker/data/heightmap.png', (road_grid[j].position.x, road_grid[j].position.y), origin)
-                    Road(
-                        [Point3D(point_1[0], point_1[1], point_1[2]), Point3D(point_2[0], point_2[1], point_2[2])], 9)
+                    points = transpose_form_heightmap_array(
+                        heightmap, [(road_grid[i].position.x, road_grid[i].position.y),
+                                    (road_grid[j].position.x, road_grid[j].position.y)], origin)
+                    Road(Point3D.from_arrays(points.tolist()), 9)
 
 
-def set_roads(skeleton: Skeleton, origin):
+def set_roads(skeleton: Skeleton, origin, verbose: int = 1, editor: Editor = None):
     # Parsing
     print("[Roads] Start parsing...")
+    road_heightmap = handle_import_array('./world_maker/data/road_heightmap.png')
+    coordinates = np.asarray(skeleton.coordinates).reshape(-1, 3)
     for i in range(len(skeleton.lines)):
         print(f"[Roads] Parsing skeleton {i + 1}/{len(skeleton.lines)}.")
-        for j in range(len(skeleton.lines[i])):
-            xyz = transpose_form_heightmap('./world_maker/data/heightmap.png',
-                                           skeleton.coordinates[skeleton.lines[i][j]], origin)
-            heightmap_smooth = Image.open(
-                './world_maker/data/road_heightmap.png')
-            skeleton.lines[i][j] = [xyz[0], heightmap_smooth.getpixel(
-                (skeleton.coordinates[skeleton.lines[i][j]][0], skeleton.coordinates[skeleton.lines[i][j]][-1])), xyz[2]]
+        skeleton.lines[i] = transpose_form_heightmap_array(
+            road_heightmap, coordinates[np.asarray(skeleton.lines[i], dtype=np.intp)], origin)
 
     print("[Roads] Start simplification...")
     # Simplification
     for i in range(len(skeleton.lines)):
         print(f"[Roads] Simplify skelton {i + 1}/{len(skeleton.lines)}")
-        print(f"[Roads] Number of points: {len(skeleton.lines[i])}")
-        skeleton.lines[i] = simplify_coordinates(skeleton.lines[i], 20)
-        j = 0
-        while j < len(skeleton.lines[i])-1:
-            print(f"[Distance] {Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2]))}")
-            if Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2])) <= 20:
-                print(skeleton.lines[i][j+1], skeleton.lines[i][j])
-                del skeleton.lines[i][j+1]
-                print("[Roads] Delete point to close")
-            j += 1
-        j = 0
-        while j < len(skeleton.lines[i])-1:
-            print(f"[Distance] {Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2]))}")
-            if Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2])) <= 10:
-                print(skeleton.lines[i][j+1], skeleton.lines[i][j])
-                del skeleton.lines[i][j+1]
-                print("[Roads] Delete point to close")
-            j += 1
-        j = 0
-        while j < len(skeleton.lines[i])-1:
-            print(f"[Distance] {Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2]))}")
-            if Point3D(skeleton.lines[i][j][0], skeleton.lines[i][j][1], skeleton.lines[i][j][2]).distance(Point3D(skeleton.lines[i][j+1][0], skeleton.lines[i][j+1][1], skeleton.lines[i][j+1][2])) <= 10:
-                print(skeleton.lines[i][j+1], skeleton.lines[i][j])
-                del skeleton.lines[i][j+1]
-                print("[Roads] Delete point to close")
-            j += 1
-        print(
-            f"[Roads] Number of points after simplification: {len(skeleton.lines[i])}")
+        skeleton.lines[i] = prepare_road(skeleton.lines[i], 20, (20, 10, 10), verbose).tolist()
 
     print("[Roads] Start generation...")
     for i in range(len(skeleton.lines)):
         print(f"[Roads] Generating roads {i + 1}/{len(skeleton.lines)}.")
         if len(skeleton.lines[i]) >= 4:
-            Road(Point3D.from_arrays(skeleton.lines[i]), 9)
+            Road(Point3D.from_arrays(skeleton.lines[i]), 9, editor)
             print(f"[ROAD] Points: {skeleton.lines[i]}")
 
 
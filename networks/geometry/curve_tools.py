@@ -1,7 +1,8 @@
+import heapq
 import numpy as np
 import networks.geometry.segment_tools as segment_tools
 from scipy import interpolate
-from math import sqrt
+from math import inf, sqrt
 
 
 def curve(target_points, resolution=40):
@@ -108,34 +109,124 @@ def resolution_distance(target_points, spacing_distance):
     return round(length / spacing_distance), length
 
 
-def simplify_segments(points, epsilon):
-    if len(points) < 3:
-        return points
+def chord_distances(points, start, end):
+    """Get the distance of the points between start and end to the chord (start, end).
 
-    # Find the point with the maximum distance
-    max_distance = 0
-    max_index = 0
-    end_index = len(points) - 1
+    Args:
+        points (np.array): array of 3d points (2d points are padded with a zero z)
+        start (int): index of the first point of the chord
+        end (int): index of the last point of the chord
+
+    Returns:
+        np.array: distances of points[start + 1:end] to the chord, or to points[start] if the chord is a single point
+    """
+    chord = points[end] - points[start]
+    vectors = points[start + 1:end] - points[start]
+    length = np.linalg.norm(chord)
+    if length == 0:
+        return np.linalg.norm(vectors, axis=1)
+    return np.linalg.norm(np.cross(vectors, chord), axis=1) / length
 
-    for i in range(1, end_index):
-        distance = get_distance(points[i], points[0])
-        if distance > max_distance:
-            max_distance = distance
-            max_index = i
 
-    simplified_points = []
+def rdp_indices(points, epsilon):
+    """Ramer-Douglas-Peucker simplification, iterative so long lines do not reach the recursion limit.
 
-    # If the maximum distance is greater than epsilon, recursively simplify
-    if max_distance > epsilon:
-        rec_results1 = simplify_segments(points[:max_index+1], epsilon)
-        rec_results2 = simplify_segments(points[max_index:], epsilon)
+    Args:
+        points (np.array): array of 3d points
+        epsilon (float): maximum distance between the removed points and the simplified line
+
+    Returns:
+        np.array: sorted indices of the kept points
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        distances = chord_distances(points, start, end)
+        index = int(np.argmax(distances))
+        if distances[index] > epsilon:
+            index += start + 1
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def visvalingam_indices(points, epsilon):
+    """Visvalingam-Whyatt simplification: remove the point making the smallest triangle with its neighbors until
+    every triangle is larger than epsilon.
+
+    Args:
+        points (np.array): array of 3d points
+        epsilon (float): minimum area of the triangles of the kept points
 
-        # Combine the simplified sub-results
-        simplified_points.extend(rec_results1[:-1])
-        simplified_points.extend(rec_results2)
+    Returns:
+        np.array: sorted indices of the kept points
+    """
+    count = len(points)
+    removed = np.zeros(count, dtype=bool)
+
+    coordinates = points.tolist()
+    previous = list(range(-1, count - 1))
+    following = list(range(1, count + 1))
+
+    def area(i):
+        (ax, ay, az), (bx, by, bz), (cx, cy, cz) = coordinates[previous[i]], coordinates[i], coordinates[following[i]]
+        ux, uy, uz, vx, vy, vz = ax - bx, ay - by, az - bz, cx - bx, cy - by, cz - bz
+        return sqrt((uy * vz - uz * vy) ** 2 + (uz * vx - ux * vz) ** 2 + (ux * vy - uy * vx) ** 2) / 2
+
+    areas = [inf] * count
+    areas[1:-1] = (np.linalg.norm(np.cross(points[:-2] - points[1:-1], points[2:] - points[1:-1]), axis=1) / 2).tolist()
+    heap = [(areas[i], i) for i in range(1, count - 1)]
+    heapq.heapify(heap)
+    while heap:
+        value, i = heapq.heappop(heap)
+        if removed[i] or value != areas[i]:
+            continue
+        if value > epsilon:
+            break
+        removed[i] = True
+        before, after = previous[i], following[i]
+        following[before], previous[after] = after, before
+        for neighbor in (before, after):
+            if 0 < neighbor < count - 1:
+                # The area of a neighbor can not become smaller than the one removed, to keep the order.
+                areas[neighbor] = max(area(neighbor), value)
+                heapq.heappush(heap, (areas[neighbor], neighbor))
+    return np.flatnonzero(~removed)
+
+
+def simplify_polyline(points, epsilon, method="rdp"):
+    """Simplify a 2d or 3d line, keeping its first and last points.
+
+    Args:
+        points (list): points of the line, as sequences of 2 or 3 coordinates
+        epsilon (float): maximum distance to the simplified line for "rdp", minimum triangle area for "visvalingam"
+        method (str, optional): "rdp" (Ramer-Douglas-Peucker) or "visvalingam" (Visvalingam-Whyatt).
+
+    Returns:
+        list: the kept points, unchanged
+
+    >>> simplify_polyline([(0, 0), (1, 0.1), (2, 0), (3, 5), (4, 0)], 1)
+    [(0, 0), (2, 0), (3, 5), (4, 0)]
+    """
+    if len(points) < 3:
+        return points
+    if method not in ("rdp", "visvalingam"):
+        raise ValueError(f"Unknown simplification method {method}")
+
+    coordinates = np.asarray(points, dtype=np.float64)
+    if coordinates.shape[1] == 2:
+        coordinates = np.column_stack((coordinates, np.zeros(len(coordinates))))
+    if method == "rdp":
+        indices = rdp_indices(coordinates, epsilon)
     else:
-        # The maximum distance is less than epsilon, retain the endpoints
-        simplified_points.append(points[0])
-        simplified_points.append(points[end_index])
+        indices = visvalingam_indices(coordinates, epsilon)
+    return [points[i] for i in indices]
+
 
-    return simplified_points
+def simplify_segments(points, epsilon):
+    return simplify_polyline(points, epsilon)
@@ -6,7 +6,7 @@ from collections import Counter
 from PIL import Image
 import random
 
-from gdpc import Editor
+from utils.EditorSession import get_session
 
 
 class Skeleton:
@@ -141,9 +141,7 @@ class Skeleton:
         Returns:
             image: 2D path of the skeleton on top of the heightmap.
         """
-        editor = Editor()
-
-        buildArea = editor.getBuildArea()
+        buildArea = get_session().build_area
         buildRect = buildArea.toRect()
         xzStart = buildRect.begin
         xzDistance = (max(buildRect.end[0], buildRect.begin[0]) - min(buildRect.end[0], buildRect.begin[0]), max(
@@ -1,7 +1,6 @@
 import networks.legacy_roads.Skeleton as Skeleton
 import networks.legacy_roads.house as house
 from math import sqrt
-from gdpc import Editor
 import sys
 from gdpc import Block as place
 import numpy as np
@@ -9,6 +8,8 @@ import networks.legacy_roads.maths as maths
 import math
 
 import networks.legacy_roads.tools as tools
+import networks.geometry.curve_tools as curve_tools
+from utils.EditorSession import get_session
 
 import random
 from random import randint
@@ -470,47 +471,17 @@ def get_distance(point1, point2):
 
 
 def simplify_coordinates(coordinates, epsilon):
-    if len(coordinates) < 3:
-        return coordinates
-
-    # Find the point with the maximum distance
-    max_distance = 0
-    max_index = 0
-    end_index = len(coordinates) - 1
-
-    for i in range(1, end_index):
-        distance = get_distance(coordinates[i], coordinates[0])
-        if distance > max_distance:
-            max_distance = distance
-            max_index = i
-
-    simplified_coordinates = []
-
-    # If the maximum distance is greater than epsilon, recursively simplify
-    if max_distance > epsilon:
-        rec_results1 = simplify_coordinates(coordinates[:max_index+1], epsilon)
-        rec_results2 = simplify_coordinates(coordinates[max_index:], epsilon)
-
-        # Combine the simplified sub-results
-        simplified_coordinates.extend(rec_results1[:-1])
-        simplified_coordinates.extend(rec_results2)
-    else:
-        # The maximum distance is less than epsilon, retain the endpoints
-        simplified_coordinates.append(coordinates[0])
-        simplified_coordinates.append(coordinates[end_index])
-
-    return simplified_coordinates
+    return curve_tools.simplify_polyline(coordinates, epsilon)
 
 
 def irlToMc(coordinates):
 
     heightmap = Image.open('./world_maker/data/heightmap.png')
 
-    editor = Editor()
-    buildArea = editor.getBuildArea()
-    xMin = (editor.getBuildArea().begin).x
-    yMin = (editor.getBuildArea().begin).y
-    zMin = (editor.getBuildArea().begin).z
+    buildArea = get_session().build_area
+    xMin = (buildArea.begin).x
+    yMin = (buildArea.begin).y
+    zMin = (buildArea.begin).z
 
     print(xMin, yMin, zMin)
 
@@ -549,10 +520,10 @@ def setRoads(skeleton):
     for i in range(len(housesCoordinates)):
         pos = housesCoordinates[i]
         # print(pos, "pos0")
-        editor = Editor()
-        xMin = (editor.getBuildArea().begin).x
-        yMin = (editor.getBuildArea().begin).y
-        zMin = (editor.getBuildArea().begin).z
+        buildArea = get_session().build_area
+        xMin = (buildArea.begin).x
+        yMin = (buildArea.begin).y
+        zMin = (buildArea.begin).z
         base = findGround((xMin, zMin), pos)
         if base != None:
             # print(pos, "pos1")
@@ -577,9 +548,9 @@ def setRoads(skeleton):
                 pos1[2],
             )
             # print(pos1, pos2, pos3, pos4, "pos")
-            xMin = (editor.getBuildArea().begin).x
-            yMin = (editor.getBuildArea().begin).y
-            zMin = (editor.getBuildArea().begin).z
+            xMin = (buildArea.begin).x
+            yMin = (buildArea.begin).y
+            zMin = (buildArea.begin).z
             Ypos1 = findGround((xMin, zMin), pos1)
             Ypos2 = findGround((xMin, zMin), pos2)
             Ypos3 = findGround((xMin, zMin), pos3)
@@ -5,7 +5,8 @@ import networks.roads.lines.Line as Line
 import json
 import random
 
-from gdpc import Editor, Block, geometry
+from gdpc import Block, geometry
+from utils.EditorSession import get_session
 
 
 class Road:
@@ -15,7 +16,7 @@ class Road:
         self.width = 10  # TODO
 
     def place_roads(self):
-        editor = Editor(buffering=True)
+        editor = get_session().editor
 
         self.resolution, self.distance = curve_tools.resolution_distance(
             self.coordinates, 12)
@@ -9,6 +9,7 @@ from networks.geometry.Segment3D import Segment3D
 from networks.geometry.Circle import Circle
 from utils.Enums import LINE_THICKNESS_MODE
 from gdpc import Block, Editor, geometry
+from utils.EditorSession import get_session
 from scipy.ndimage import gaussian_filter1d
 import numpy as np
 import random
@@ -17,7 +18,8 @@ from PIL import Image
 
 
 class Road:
-    def __init__(self, coordinates: List[Point3D], width: int):
+    def __init__(self, coordinates: List[Point3D], width: int, editor: Editor = None):
+        self.editor = editor
         self.coordinates = self._remove_collinear_points(coordinates)
         self.output_block = []
         # with open(road_configuration) as f:
@@ -279,7 +281,7 @@ class Road:
                 self.segment_total_line_output[i].x, reference[self.segment_total_line_output[i].nearest(Point3D.to_2d(reference, 'y'), True)[0]].y, self.segment_total_line_output[i].y), Block("black_concrete")))
 
     def place(self):
-        editor = Editor(buffering=True)
+        editor = self.editor if self.editor is not None else get_session().editor
         for i in range(len(self.output_block)):
             editor.placeBlock(self.output_block[i][0],
                               self.output_block[i][1])
@@ -0,0 +1,95 @@
+import contextlib
+import io
+import random
+import time
+import numpy as np
+from scipy import ndimage
+from world_maker.City import City
+from world_maker.MapRegistry import maps
+from world_maker.Position import Position
+
+
+def generate_maps(size, seed):
+    # Terraced random terrain, so the height constraint cuts the districts, and a strip of water.
+    rng = np.random.default_rng(seed)
+    heightmap = (60 + ndimage.gaussian_filter(rng.random((size, size)), 6) * 400 % 30).astype(np.uint8)
+    watermap = np.zeros((size, size), np.uint8)
+    watermap[:, :8] = 255
+    maps.set('heightmap', heightmap)
+    maps.set('watermap', watermap)
+
+
+def make_city(size, seed, districts=8):
+    generate_maps(size, seed)
+    random.seed(seed)
+    city = City()
+    for i in range(districts):
+        city.add_district(Position(random.randint(10, size - 1), random.randint(0, size - 1)),
+                          "mountain" if i == 0 else "")
+    return city
+
+
+def legacy_expansion(map_data, height_map, centers, types):
+    """
+    The point by point expansion as it was written with lists, kept as the reference of the labels.
+    """
+    map_data = [list(row) for row in map_data]
+    from_points = [[center] for center in centers]
+    expends = [[] for _ in centers]
+
+    def choose(point, index_district):
+        min_distance = point.distance_to(centers[index_district])
+        chosen = index_district
+        for index in range(index_district + 1, len(centers)):
+            if point in expends[index]:
+                distance = point.distance_to(centers[index])
+                if distance < min_distance:
+                    min_distance = distance
+                    expends[chosen].remove(point)
+                    chosen = index
+                else:
+                    expends[index].remove(point)
+        from_points[chosen].append(point)
+        expends[chosen].remove(point)
+        map_data[point.y][point.x] = chosen + 1
+
+    while any(from_points):
+        for index in range(len(centers)):
+            if from_points[index]:
+                point = from_points[index][0]
+                for vector in [Position(1, 0), Position(-1, 0), Position(0, 1), Position(0, -1)]:
+                    new = point + vector
+                    if (0 <= new.x < len(map_data[0]) and 0 <= new.y < len(map_data) and map_data[new.y][new.x] == 0
+                            and (types[index] == "mountain" or abs(height_map[new.y][new.x] - height_map[point.y][point.x]) < 2)
+                            and new not in expends[index]):
+                        expends[index].append(new)
+                from_points[index].remove(point)
+        for index in range(len(centers)):
+            for point in expends[index]:
+                choose(point, index)
+    return np.array(map_data)
+
+
+def expand(city, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        city.loop_expend_district(**kwargs)
+    return city.map_data
+
+
+def test_default_expansion_matches_legacy():
+    for size, seed in [(60, 0), (120, 3)]:
+        city = make_city(size, seed)
+        expected = legacy_expansion(city.map_data.tolist(), city.height_map.tolist(),
+                                    [district.center_expend for district in city.districts],
+                                    [district.type for district in city.districts])
+        assert np.array_equal(expand(city), expected)
+
+
+if __name__ == "__main__":
+    test_default_expansion_matches_legacy()
+    for multi_source in (False, True):
+        city = make_city(400, 1)
+        start_time = time.time()
+        expand(city, multi_source=multi_source)
+        print(f"multi_source={multi_source}: {time.time() - start_time:.2f} seconds")
+    print("District expansion tests passed.")
@@ -0,0 +1,42 @@
+from itertools import permutations
+from gdpc import Block, Editor, interface
+from utils.EditorSession import EditorSession
+from utils.OfflineServer import OfflineServer, OfflineWorld
+
+
+def test_close_in_any_order():
+    original = interface.requests
+    for order in permutations(range(3)):
+        sessions = [EditorSession() for _ in range(3)]
+        for closed, index in enumerate(order):
+            sessions[index].close()
+            opened = [session for session in sessions if not session.closed]
+            # The transport of the last session opened is used, never a closed one.
+            expected = opened[-1]._transport if opened else original
+            assert interface.requests is expected, (order, closed)
+        assert interface.requests is original
+
+
+def test_flushing_threads_use_their_own_connections():
+    server = OfflineServer(OfflineWorld.synthetic(32, 0), port=0).start()
+    host, port = server.http.server_address[:2]
+    session = EditorSession(multithreading=True, workers=4, buffer_limit=16, host=f"http://{host}:{port}")
+    try:
+        x, _, z = session.build_area.begin
+        for dx in range(16):
+            for dz in range(16):
+                session.editor.placeBlockGlobal((x + dx, 150, z + dz), Block("stone"))
+        session.flush()
+        transport = session._transport
+        assert len(transport.sessions) > 1
+        # Any Editor of the process goes through the transport of the open session.
+        assert Editor(host=f"http://{host}:{port}").getBlockGlobal((x + 15, 150, z + 15)).id == "minecraft:stone"
+    finally:
+        session.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_close_in_any_order()
+    test_flushing_threads_use_their_own_connections()
+    print("Editor session tests passed.")
@@ -0,0 +1,36 @@
+from gdpc import Block, Editor
+from utils.OfflineServer import OfflineServer, OfflineWorld
+
+
+def start_server(size=32, seed=0):
+    # Port 0: any free port, so the test does not need the one of a running game.
+    server = OfflineServer(OfflineWorld.synthetic(size, seed), port=0).start()
+    host, port = server.http.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def test_place_blocks_with_data():
+    server, host = start_server()
+    try:
+        x, _, z = server.world.build_area[:3]
+        blocks = [
+            Block("chest", {"facing": "north"}, '{Items:[{Slot:0b,id:"minecraft:apple",Count:1b}]}'),
+            Block("oak_sign", {"rotation": "4"}, "{Text1:'It\\'s here'}"),
+            Block("stone"),
+        ]
+        for buffering in (False, True):
+            editor = Editor(buffering=buffering, host=host)
+            for dx, block in enumerate(blocks):
+                editor.placeBlockGlobal((x + dx, 200, z + int(buffering)), block)
+            editor.flushBuffer()
+            for dx, block in enumerate(blocks):
+                placed = editor.getBlockGlobal((x + dx, 200, z + int(buffering)))
+                assert placed.id == "minecraft:" + block.id
+                assert placed.states == block.states
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_place_blocks_with_data()
+    print("Offline server tests passed.")
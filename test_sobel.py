@@ -0,0 +1,51 @@
+import time
+import numpy as np
+from PIL import Image
+from scipy import ndimage
+from world_maker.data_analysis import filter_sobel, filter_sobel_optimized
+
+
+class SobelTest:
+    def __init__(self, size=1024, seed=0):
+        self.size = size
+        self.heightmap = self.generate_heightmap(size, seed)
+
+    def generate_heightmap(self, size, seed):
+        # Smooth random terrain between 40 and 200, like a real heightmap.
+        rng = np.random.default_rng(seed)
+        noise = ndimage.gaussian_filter(rng.random((size, size)), 8)
+        noise = (noise - noise.min()) / (noise.max() - noise.min())
+        array = (40 + noise * 160).astype(np.uint8)
+        return Image.fromarray(array).convert('RGBA')
+
+    def run_functionality_test(self):
+        print("Running functionality test...")
+        original = np.array(filter_sobel(self.heightmap))
+        optimized = np.array(filter_sobel_optimized(self.heightmap))
+        print(f"Identical output: {np.array_equal(original, optimized)}")
+        print(f"Different pixels: {np.count_nonzero(original != optimized)}")
+        print("Functionality test completed.\n")
+
+    def measure_execution_time(self, sobel_function, name, iterations=1):
+        print(f"Measuring execution time for {name}...")
+        start_time = time.time()
+        for _ in range(iterations):
+            sobel_function(self.heightmap)
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        print(f"Execution time for {name}: {elapsed_time:.4f} seconds over {iterations} iterations.\n")
+        return elapsed_time
+
+    def compare_versions(self, iterations=1):
+        original_time = self.measure_execution_time(filter_sobel, "original", iterations)
+        optimized_time = self.measure_execution_time(filter_sobel_optimized, "optimized", iterations)
+
+        improvement = ((original_time - optimized_time) / original_time) * 100
+        print(f"Optimized filter is {improvement:.2f}% faster than the original filter "
+              f"({original_time / optimized_time:.1f}x).\n")
+
+
+if __name__ == "__main__":
+    tester = SobelTest(1024)
+    tester.run_functionality_test()
+    tester.compare_versions()
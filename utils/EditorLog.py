@@ -0,0 +1,244 @@
+"""
+Record and replay of the traffic of a gdpc Editor.
+
+RecordingEditor is an Editor which appends every block placement, block read and command to an EditorLog, tagged with
+the current stage. The log is saved as numpy arrays, and replay re-sends it to any editor at full speed, to measure
+the transport apart from the generation and to compare buffering settings.
+
+Set GDMC_RECORD to a file name to record a run of main.py. Replay a log with:
+    python -m utils.EditorLog log.npz [buffer_limit] [workers] [host]
+GDMC_OFFLINE_WORLD is honoured, so the target can be the offline server (see utils/OfflineServer.py).
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from gdpc import Block, Editor
+from glm import ivec3
+
+RECORD_ENV = "GDMC_RECORD"
+
+PLACE, GET, COMMAND, POSITIONED_COMMAND = range(4)
+OPERATIONS = ("place", "get", "command", "positioned command")
+
+RECORD_DTYPE = np.dtype([
+    ("operation", "u1"),
+    ("stage", "u1"),
+    ("x", "<i4"),
+    ("y", "<i2"),
+    ("z", "<i4"),
+    ("value", "<u4"),  # Index in the blocks table, or in the commands table for commands.
+    ("time", "<f4"),  # Seconds since the creation of the log.
+])
+
+
+class EditorLog:
+    """
+    Editor operations, kept as columns while recording and as a structured array once saved.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.columns = tuple([] for _ in RECORD_DTYPE.names)
+        self.stages = ["none"]
+        self.current = 0
+        self.blocks = []
+        self.block_index = {}
+        self.commands = []
+
+    @classmethod
+    def from_environment(cls) -> "EditorLog":
+        """
+        Empty log if GDMC_RECORD is set, None otherwise.
+        """
+        return cls() if os.environ.get(RECORD_ENV) else None
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Tag the operations recorded in the block with the stage name.
+        """
+        previous = self.current
+        if name not in self.stages:
+            self.stages.append(name)
+        self.current = self.stages.index(name)
+        try:
+            yield self
+        finally:
+            self.current = previous
+
+    def append(self, operation: int, position, value: int):
+        for column, item in zip(self.columns, (operation, self.current, position[0], position[1], position[2],
+                                               value, time.perf_counter() - self.start)):
+            column.append(item)
+
+    def block(self, block: Block) -> int:
+        """
+        Index of a block in the blocks table, added if it is new.
+        """
+        key = (block.id, tuple(block.states.items()), block.data)
+        index = self.block_index.get(key)
+        if index is None:
+            index = self.block_index[key] = len(self.blocks)
+            self.blocks.append(key)
+        return index
+
+    def command(self, command: str) -> int:
+        self.commands.append(command)
+        return len(self.commands) - 1
+
+    @property
+    def records(self) -> np.ndarray:
+        records = np.empty(len(self.columns[0]), dtype=RECORD_DTYPE)
+        for name, column in zip(RECORD_DTYPE.names, self.columns):
+            records[name] = column
+        return records
+
+    def save(self, path: str):
+        """
+        Save the log in a compressed numpy archive.
+        """
+        blocks = np.array([(block_id, json.dumps(dict(states)), data or "") for block_id, states, data in self.blocks],
+                          dtype=str).reshape(-1, 3)
+        np.savez_compressed(path, records=self.records, stages=np.array(self.stages), blocks=blocks,
+                            commands=np.array(self.commands, dtype=str))
+
+    @classmethod
+    def load(cls, path: str) -> "EditorLog":
+        log = cls()
+        with np.load(path) as archive:
+            records = archive["records"]
+            log.columns = tuple(records[name].tolist() for name in RECORD_DTYPE.names)
+            log.stages = archive["stages"].tolist()
+            log.blocks = [(block_id, tuple(json.loads(states).items()), data or None)
+                          for block_id, states, data in archive["blocks"].tolist()]
+            log.block_index = {block: i for i, block in enumerate(log.blocks)}
+            log.commands = archive["commands"].tolist()
+        return log
+
+    def gdpc_blocks(self) -> list[Block]:
+        """
+        Blocks of the blocks table.
+        """
+        return [Block(block_id, dict(states), data) for block_id, states, data in self.blocks]
+
+    def summary(self) -> str:
+        """
+        Number of operations of each kind, duration and placement rate of each stage.
+        """
+        records = self.records
+        lines = []
+        for index, name in enumerate(self.stages):
+            stage = records[records["stage"] == index]
+            if len(stage) == 0:
+                continue
+            counts = np.bincount(stage["operation"], minlength=len(OPERATIONS))
+            duration = float(stage["time"][-1] - stage["time"][0])
+            line = f"[EditorLog] {name}: " + ", ".join(
+                f"{count} {operation}" for operation, count in zip(OPERATIONS, counts) if count) + f" in {duration:.2f} s"
+            if counts[PLACE] and duration > 0:
+                line += f" ({counts[PLACE] / duration:.0f} blocks/s)"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class RecordingEditor(Editor):
+    """
+    Editor recording its placements, reads and commands in a log. Placements are recorded in global coordinates, after
+    the replace check and the palette choice, and whether they are buffered or not.
+    """
+
+    def __init__(self, log: EditorLog, *args, **kwargs):
+        """
+        Args:
+            log (EditorLog): log to record in, can be shared by several editors.
+            *args, **kwargs: arguments of Editor.
+        """
+        super().__init__(*args, **kwargs)
+        self.log = log
+
+    def _placeSingleBlockGlobalDirect(self, position, block: Block):
+        self.log.append(PLACE, position, self.log.block(block))
+        return super()._placeSingleBlockGlobalDirect(position, block)
+
+    def _placeSingleBlockGlobalBuffered(self, position, block: Block):
+        self.log.append(PLACE, position, self.log.block(block))
+        return super()._placeSingleBlockGlobalBuffered(position, block)
+
+    def getBlockGlobal(self, position):
+        block = super().getBlockGlobal(position)
+        self.log.append(GET, position, self.log.block(block))
+        return block
+
+    def runCommandGlobal(self, command: str, position=None, syncWithBuffer=False):
+        if position is None:
+            self.log.append(COMMAND, (0, 0, 0), self.log.command(command))
+        else:
+            self.log.append(POSITIONED_COMMAND, position, self.log.command(command))
+        super().runCommandGlobal(command, position, syncWithBuffer)
+
+
+def replay(log: EditorLog, editor: Editor, stages: list[str] = None, gets: bool = False) -> dict[str, tuple[int, float]]:
+    """
+    Re-send the operations of a log to an editor, stage by stage, without any generation in between.
+    The buffer of the editor is flushed at the end of each stage, so the times include the transport.
+
+    Args:
+        log (EditorLog): recorded operations.
+        editor (Editor): target editor, with the buffering settings to benchmark.
+        stages (list): names of the stages to replay, all by default.
+        gets (bool): also replay the block reads.
+
+    Returns:
+        dict: number of operations sent and seconds taken, by stage name.
+    """
+    records = log.records
+    blocks = log.gdpc_blocks()
+    results = {}
+    for index, name in enumerate(log.stages):
+        if stages is not None and name not in stages:
+            continue
+        stage = records[records["stage"] == index]
+        if len(stage) == 0:
+            continue
+        operations = stage["operation"].tolist()
+        positions = np.stack((stage["x"], stage["y"], stage["z"]), axis=1).tolist()
+        values = stage["value"].tolist()
+
+        start = time.perf_counter()
+        sent = 0
+        for operation, position, value in zip(operations, positions, values):
+            if operation == PLACE:
+                editor.placeBlockGlobal(ivec3(*position), blocks[value])
+            elif operation == GET:
+                if not gets:
+                    continue
+                editor.getBlockGlobal(ivec3(*position))
+            else:
+                editor.runCommandGlobal(log.commands[value], position if operation == POSITIONED_COMMAND else None,
+                                        syncWithBuffer=True)
+            sent += 1
+        editor.flushBuffer()
+        editor.awaitBufferFlushes()
+        results[name] = (sent, time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+    from utils.OfflineServer import OfflineServer
+
+    server = OfflineServer.from_environment()
+    buffer_limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1024
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    target = Editor(buffering=True, bufferLimit=buffer_limit, multithreading=workers > 1,
+                    multithreadingWorkers=workers, **({"host": sys.argv[4]} if len(sys.argv) > 4 else {}))
+    recorded = EditorLog.load(sys.argv[1])
+    print(recorded.summary())
+    for name, (sent, seconds) in replay(recorded, target).items():
+        print(f"[Replay] {name}: {sent} operations in {seconds:.2f} s ({sent / max(seconds, 1e-9):.0f} /s)")
+    if server is not None:
+        server.stop()
@@ -0,0 +1,162 @@
+"""
+One gdpc Editor shared by every generation stage.
+
+The session owns the editor (buffer limit and multithreaded flushing are configurable), caches the build area, and
+sends the requests of gdpc through persistent HTTP connections instead of opening one per request.
+Stages take a session argument, and fall back on the default session of the process given by get_session.
+
+gdpc has no transport per Editor: every request goes through the requests module global of gdpc.interface. A session
+replaces that global while it is open, so the pooled connections are process-wide: every Editor of the process uses
+them, not only the one of the session. Closing a session puts back the transport it replaced, or the first one still
+open if that one was closed meanwhile, so sessions can be closed in any order.
+"""
+
+import atexit
+import threading
+
+import requests
+from gdpc import Editor, interface
+from gdpc.vector_tools import Box, Rect
+from requests.adapters import HTTPAdapter
+
+
+class PooledTransport:
+    """
+    Stand-in for the requests module in gdpc.interface, which only calls requests.request: the requests go through a
+    requests.Session, which keeps its connections alive. Each thread, like the flushing threads of an editor, has its
+    own requests.Session, as they are not meant to be shared between threads.
+    """
+
+    def __init__(self, previous=None):
+        """
+        Args:
+            previous: transport it replaces in gdpc.interface, put back when it is closed.
+        """
+        self.previous = previous
+        self.closed = False
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    @property
+    def http(self) -> requests.Session:
+        """
+        Session of the calling thread, created on its first request.
+        """
+        http = getattr(self.local, "http", None)
+        if http is None:
+            http = self.local.http = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            http.mount("http://", adapter)
+            http.mount("https://", adapter)
+            with self.lock:
+                self.sessions.append(http)
+        return http
+
+    def request(self, method: str, url: str, *args, **kwargs) -> requests.Response:
+        return self.http.request(method, url, *args, **kwargs)
+
+    def close(self):
+        """
+        Close the connections of every thread and put back the first transport it replaced which is still open.
+        """
+        self.closed = True
+        with self.lock:
+            for http in self.sessions:
+                http.close()
+        if interface.requests is self:
+            previous = self.previous
+            while isinstance(previous, PooledTransport) and previous.closed:
+                previous = previous.previous
+            interface.requests = previous
+
+
+class EditorSession:
+    """
+    Shared editor, cached build area and pooled HTTP connections.
+    """
+
+    def __init__(self, editor: Editor = None, buffer_limit: int = 1024, multithreading: bool = False,
+                 workers: int = 1, pool: bool = True, **kwargs):
+        """
+        Args:
+            editor (Editor): editor to share, like a RecordingEditor. A buffering one is created if None.
+            buffer_limit (int): number of blocks buffered before a flush.
+            multithreading (bool): flush the buffer in background threads.
+            workers (int): number of flushing threads.
+            pool (bool): send the requests of the process through persistent connections, one per thread.
+            **kwargs: other arguments of Editor, like retries, timeout or host.
+        """
+        if editor is None:
+            editor = Editor(buffering=True, bufferLimit=buffer_limit, multithreading=multithreading,
+                            multithreadingWorkers=workers, **kwargs)
+        self.editor = editor
+        self._build_area = None
+        self._transport = None
+        self.closed = False
+        if pool:
+            self._transport = PooledTransport(interface.requests)
+            interface.requests = self._transport
+
+    @property
+    def build_area(self) -> Box:
+        """
+        Build area, requested once.
+        """
+        if self._build_area is None:
+            self._build_area = self.editor.getBuildArea()
+        return self._build_area
+
+    @property
+    def build_rect(self) -> Rect:
+        return self.build_area.toRect()
+
+    def flush(self):
+        """
+        Send the buffered blocks and commands, and wait for the flushing threads.
+        """
+        self.editor.flushBuffer()
+        self.editor.awaitBufferFlushes()
+
+    def close(self):
+        """
+        Flush the editor and close the pooled connections. gdpc goes back to the transport it used before the session.
+        Closing a closed session does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+_session = None
+
+
+def get_session() -> EditorSession:
+    """
+    Default session of the process, created with the default settings on the first call and closed at exit.
+    """
+    if _session is None:
+        set_session(EditorSession())
+    return _session
+
+
+def set_session(session: EditorSession) -> EditorSession:
+    """
+    Make a session the default one, used by the stages called without a session. The session it replaces is closed,
+    and the default session is closed at exit.
+    """
+    global _session
+    if _session is not None and _session is not session:
+        _session.close()
+    _session = session
+    return session
+
+
+@atexit.register
+def _close_session():
+    if _session is not None:
+        _session.close()
@@ -0,0 +1,698 @@
+"""
+Offline stand-in for the GDMC HTTP interface.
+
+Serves the endpoints gdpc uses (build area, chunks with heightmaps, block reads and placements, biomes and the
+fill / setblock commands) from a world kept in memory, so the generator can run end-to-end without a game client.
+The world is either generated from a seed or loaded from a file saved by a previous run.
+
+Set the GDMC_OFFLINE_WORLD environment variable to use it from main.py:
+    GDMC_OFFLINE_WORLD=synthetic              synthetic world, seed 0, 256x256 build area
+    GDMC_OFFLINE_WORLD=synthetic:7:512        synthetic world, seed 7, 512x512 build area
+    GDMC_OFFLINE_WORLD=./worlds/city.npz      world saved with OfflineWorld.save
+GDMC_OFFLINE_SAVE can name a file where the world is saved when the server stops.
+
+Block entity data, entities, block updates and physics are not simulated.
+"""
+
+import ast
+import json
+import os
+import re
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil, log2
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from gdpc import lookup
+from scipy import ndimage
+
+WORLD_ENV = "GDMC_OFFLINE_WORLD"
+SAVE_ENV = "GDMC_OFFLINE_SAVE"
+
+DEFAULT_PORT = 9000
+VERSION = "1.20.2"
+
+# Vertical bounds of an overworld chunk since 1.18.
+Y_BEGIN = -64
+Y_SIZE = 384
+SEA_LEVEL = 62
+
+# Same limit as the fill command of the game.
+FILL_LIMIT = 32768
+
+HEIGHTMAP_TYPES = ("MOTION_BLOCKING", "MOTION_BLOCKING_NO_LEAVES", "OCEAN_FLOOR", "WORLD_SURFACE")
+
+# Blocks that do not block motion, beside the fluids.
+PASSABLE = lookup.AIRS | lookup.FLOWERS | (lookup.GRASSES - {"minecraft:grass_block"}) | {
+    block for block in lookup.TREES if block.endswith("_sapling")}
+
+BLOCK_PATTERN = re.compile(r"^\s*([^\[{\s]+)\s*(?:\[([^\]]*)\])?")
+# JSON strings, skipped, or the data field of a block, that gdpc writes as a Python string literal.
+DATA_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|,"data":(\'(?:[^\'\\]|\\.)*\'|"(?:[^"\\]|\\.)*")')
+
+TAG_END, TAG_BYTE, TAG_INT, TAG_STRING, TAG_LIST, TAG_COMPOUND, TAG_LONG_ARRAY = 0, 1, 3, 8, 9, 10, 12
+
+
+def block_key(block_id: str, states: dict = None) -> str:
+    """
+    Canonical name of a block state, used as palette entry: namespaced id and sorted states.
+
+    Args:
+        block_id (str): id of the block, with or without namespace.
+        states (dict): block states.
+    """
+    if ":" not in block_id:
+        block_id = "minecraft:" + block_id
+    if not states:
+        return block_id
+    return block_id + "[" + ",".join(f"{key}={value}" for key, value in sorted(states.items())) + "]"
+
+
+def parse_block(text: str, states: dict = None) -> str:
+    """
+    Canonical name of a block written as in a command, like "oak_stairs[facing=east]". Block entity data is dropped.
+
+    Args:
+        text (str): block id, optionally followed by its states.
+        states (dict): extra states, merged with the ones of the text.
+    """
+    match = BLOCK_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"Invalid block: {text}")
+    merged = {}
+    if match.group(2):
+        for state in match.group(2).split(","):
+            key, _, value = state.partition("=")
+            merged[key.strip()] = value.strip()
+    if states:
+        merged.update({key: str(value) for key, value in states.items()})
+    return block_key(match.group(1), merged)
+
+
+def parse_blocks(body: str) -> list:
+    """
+    Blocks of a PUT /blocks body. gdpc writes it as JSON, except the block entity data which is the repr of a Python
+    string, often in single quotes: it is converted to a JSON string before decoding.
+    """
+    def data_to_json(match):
+        if match.group(1) is None:
+            return match.group(0)
+        return ',"data":' + json.dumps(ast.literal_eval(match.group(1)))
+
+    blocks = json.loads(DATA_PATTERN.sub(data_to_json, body))
+    if not isinstance(blocks, list):
+        raise ValueError("The body must be a list of blocks")
+    return blocks
+
+
+def split_key(key: str) -> tuple[str, dict]:
+    """
+    Split a canonical block name into its id and its states.
+    """
+    block_id, _, states = key.partition("[")
+    if not states:
+        return block_id, {}
+    return block_id, dict(state.split("=", 1) for state in states[:-1].split(","))
+
+
+def pack_longs(values: np.ndarray, bits: int) -> np.ndarray:
+    """
+    Pack values in a long array the way chunk data does: entries never straddle two longs.
+
+    Args:
+        values (np.ndarray): unsigned values, each fitting in bits.
+        bits (int): bits per entry.
+
+    Returns:
+        np.ndarray: big-endian signed longs, ready to be written.
+    """
+    per_long = 64 // bits
+    count = -(-len(values) // per_long)
+    padded = np.zeros(count * per_long, dtype=np.uint64)
+    padded[:len(values)] = values
+    shifts = np.arange(per_long, dtype=np.uint64) * np.uint64(bits)
+    longs = np.bitwise_or.reduce(padded.reshape(count, per_long) << shifts, axis=1)
+    return longs.view(np.int64).astype(">i8")
+
+
+def nbt_string(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack(">H", len(data)) + data
+
+
+def nbt_compound(entries: list[tuple[int, str, bytes]]) -> bytes:
+    """
+    Payload of a compound tag from (tag type, name, payload) entries.
+    """
+    return b"".join(bytes((tag,)) + nbt_string(name) + payload for tag, name, payload in entries) + bytes((TAG_END,))
+
+
+def nbt_list(tag: int, payloads: list[bytes]) -> bytes:
+    return bytes((tag if payloads else TAG_END,)) + struct.pack(">i", len(payloads)) + b"".join(payloads)
+
+
+def nbt_long_array(longs: np.ndarray) -> bytes:
+    return struct.pack(">i", len(longs)) + longs.tobytes()
+
+
+class OfflineWorld:
+    """
+    Blocks of a chunk aligned region of the overworld, stored as palette ids.
+    """
+
+    def __init__(self, blocks: np.ndarray, palette: list[str], biomes: np.ndarray, biome_palette: list[str],
+                 origin: tuple[int, int], build_area: tuple[int, int, int, int, int, int]):
+        """
+        Args:
+            blocks (np.ndarray): palette ids, indexed by (x, y - Y_BEGIN, z) relative to the origin.
+            palette (list): canonical block names.
+            biomes (np.ndarray): biome palette ids of each (x, z) column.
+            biome_palette (list): biome names.
+            origin (tuple): (x, z) of the first block of the region, multiple of 16.
+            build_area (tuple): (x_from, y_from, z_from, x_to, y_to, z_to), inclusive.
+        """
+        if origin[0] % 16 or origin[1] % 16 or blocks.shape[0] % 16 or blocks.shape[2] % 16:
+            raise ValueError("The offline world must be aligned on chunks.")
+        self.blocks = blocks
+        self.palette = list(palette)
+        self.index = {key: i for i, key in enumerate(self.palette)}
+        self.biomes = biomes
+        self.biome_palette = list(biome_palette)
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.build_area = tuple(int(value) for value in build_area)
+        self.air = self.block_index("minecraft:air")
+
+    @classmethod
+    def synthetic(cls, size: int = 256, seed: int = 0, origin: tuple[int, int] = (0, 0)) -> "OfflineWorld":
+        """
+        Generate a deterministic world: smooth hills and mountains, water under the sea level and oak trees.
+
+        Args:
+            size (int): side of the square build area.
+            seed (int): seed of the terrain and of the trees.
+            origin (tuple): (x, z) of the build area.
+        """
+        rng = np.random.default_rng(seed)
+        x_min, z_min = origin[0] >> 4 << 4, origin[1] >> 4 << 4
+        x_size = ((origin[0] + size + 15) >> 4 << 4) - x_min
+        z_size = ((origin[1] + size + 15) >> 4 << 4) - z_min
+
+        relief = ndimage.gaussian_filter(rng.standard_normal((x_size, z_size)), max(x_size, z_size) / 8, mode="wrap")
+        detail = ndimage.gaussian_filter(rng.standard_normal((x_size, z_size)), max(x_size, z_size) / 48, mode="wrap")
+        relief = (relief - relief.min()) / np.ptp(relief)
+        detail = (detail - detail.min()) / np.ptp(detail)
+        heights = (48 + 80 * relief ** 1.8 + 8 * detail).astype(np.int64)
+
+        palette = ["minecraft:air", "minecraft:bedrock", "minecraft:stone", "minecraft:dirt", "minecraft:grass_block",
+                   "minecraft:sand", "minecraft:water", "minecraft:oak_log[axis=y]",
+                   "minecraft:oak_leaves[distance=1,persistent=false,waterlogged=false]"]
+        air, bedrock, stone, dirt, grass, sand, water, log, leaves = range(len(palette))
+
+        wet = heights < SEA_LEVEL
+        top = np.where(heights <= SEA_LEVEL + 1, sand, grass).astype(np.uint16)
+        blocks = np.zeros((x_size, Y_SIZE, z_size), dtype=np.uint16)
+        for i in range(Y_SIZE):
+            y = i + Y_BEGIN
+            layer = blocks[:, i, :]
+            layer[y < heights - 3] = stone
+            layer[(y >= heights - 3) & (y < heights)] = dirt
+            layer[y == heights] = top[y == heights]
+            layer[wet & (y > heights) & (y <= SEA_LEVEL)] = water
+        blocks[:, 0, :] = bedrock
+
+        candidates = np.argwhere((top == grass) & (heights < 110))
+        count = min(len(candidates), x_size * z_size // 150)
+        for x, z in candidates[rng.choice(len(candidates), count, replace=False)]:
+            base = heights[x, z] + 1 - Y_BEGIN
+            trunk = int(rng.integers(4, 7))
+            for radius, bottom, top_layer in ((2, trunk - 2, trunk), (1, trunk, trunk + 2)):
+                crown = blocks[max(x - radius, 0):x + radius + 1, base + bottom:base + top_layer,
+                               max(z - radius, 0):z + radius + 1]
+                crown[crown == air] = leaves
+            blocks[x, base:base + trunk, z] = log
+
+        biomes = np.where(wet, 1, 0).astype(np.uint8)
+        build_area = (origin[0], 0, origin[1], origin[0] + size - 1, 255, origin[1] + size - 1)
+        return cls(blocks, palette, biomes, ["minecraft:plains", "minecraft:river"], (x_min, z_min), build_area)
+
+    @classmethod
+    def load(cls, path: str) -> "OfflineWorld":
+        """
+        Load a world saved with save.
+        """
+        with np.load(path) as data:
+            return cls(data["blocks"], data["palette"].tolist(), data["biomes"], data["biome_palette"].tolist(),
+                       tuple(data["origin"].tolist()), tuple(data["build_area"].tolist()))
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "OfflineWorld":
+        """
+        World described like the GDMC_OFFLINE_WORLD variable: "synthetic[:seed[:size]]" or the path of a saved world.
+        """
+        if spec == "synthetic" or spec.startswith("synthetic:"):
+            arguments = [int(value) for value in spec.split(":")[1:]]
+            seed = arguments[0] if len(arguments) > 0 else 0
+            size = arguments[1] if len(arguments) > 1 else 256
+            return cls.synthetic(size, seed)
+        return cls.load(spec)
+
+    def save(self, path: str):
+        """
+        Save the world in a compressed numpy archive.
+        """
+        np.savez_compressed(path, blocks=self.blocks, palette=np.array(self.palette), biomes=self.biomes,
+                            biome_palette=np.array(self.biome_palette), origin=np.array(self.origin),
+                            build_area=np.array(self.build_area))
+
+    def block_index(self, key: str) -> int:
+        """
+        Palette id of a canonical block name, added to the palette if it is new.
+        """
+        index = self.index.get(key)
+        if index is None:
+            index = self.index[key] = len(self.palette)
+            self.palette.append(key)
+        return index
+
+    def local(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Array indices of global coordinates, and the mask of the ones inside the world.
+        """
+        i, j, k = np.asarray(x) - self.origin[0], np.asarray(y) - Y_BEGIN, np.asarray(z) - self.origin[1]
+        inside = ((i >= 0) & (i < self.blocks.shape[0]) & (j >= 0) & (j < Y_SIZE)
+                  & (k >= 0) & (k < self.blocks.shape[2]))
+        return i, j, k, inside
+
+    def get_blocks(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> list[str]:
+        """
+        Canonical names of the blocks at global coordinates, void air outside of the world.
+        """
+        i, j, k, inside = self.local(x, y, z)
+        ids = np.full(len(inside), self.block_index("minecraft:void_air"), dtype=np.int64)
+        ids[inside] = self.blocks[i[inside], j[inside], k[inside]]
+        return [self.palette[index] for index in ids]
+
+    def get_biomes(self, x: np.ndarray, z: np.ndarray) -> list[str]:
+        """
+        Biomes of the columns at global coordinates, plains outside of the world.
+        """
+        i, _, k, inside = self.local(x, np.full(len(x), Y_BEGIN), z)
+        names = np.full(len(inside), "minecraft:plains", dtype=object)
+        names[inside] = np.array(self.biome_palette, dtype=object)[self.biomes[i[inside], k[inside]]]
+        return names.tolist()
+
+    def set_blocks(self, x: np.ndarray, y: np.ndarray, z: np.ndarray, keys: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Place blocks at global coordinates. The last one wins if a position is given twice.
+
+        Returns:
+            changed, inside: masks of the placements which changed a block and of the ones inside the world.
+        """
+        i, j, k, inside = self.local(x, y, z)
+        ids = np.array([self.block_index(key) for key in keys], dtype=np.uint16)
+        changed = np.zeros(len(inside), dtype=bool)
+        changed[inside] = self.blocks[i[inside], j[inside], k[inside]] != ids[inside]
+        self.blocks[i[inside], j[inside], k[inside]] = ids[inside]
+        return changed, inside
+
+    def fill(self, start: tuple[int, int, int], end: tuple[int, int, int], key: str, mode: str = "replace",
+             filter_key: str = None) -> int:
+        """
+        Fill a box like the fill command, both corners included.
+
+        Returns:
+            int: number of blocks changed.
+        """
+        low = np.minimum(start, end)
+        high = np.maximum(start, end)
+        volume = int(np.prod(high - low + 1))
+        if volume > FILL_LIMIT:
+            raise ValueError(f"Too many blocks in the specified area (maximum {FILL_LIMIT}, specified {volume})")
+        i, j, k, inside = self.local(*np.stack((low, high), axis=1))
+        if not inside.all():
+            raise ValueError("That position is not loaded")
+        box = self.blocks[i[0]:i[1] + 1, j[0]:j[1] + 1, k[0]:k[1] + 1]
+        index = self.block_index(key)
+        if mode == "keep":
+            mask = box == self.air
+        elif filter_key is not None:
+            mask = box == self.block_index(filter_key)
+        else:
+            mask = np.ones(box.shape, dtype=bool)
+        mask &= box != index
+        box[mask] = index
+        return int(mask.sum())
+
+    def heightmaps(self, i: int, k: int, x_size: int, z_size: int) -> dict[str, np.ndarray]:
+        """
+        Heightmaps of a part of the world, as stored in chunks: one above the highest matching block, from Y_BEGIN.
+
+        Args:
+            i, k (int): array indices of the first column.
+            x_size, z_size (int): size of the part.
+        """
+        names = np.array([split_key(key)[0] for key in self.palette], dtype=object)
+        fluid = np.isin(names, list(lookup.LIQUIDS)) | np.array(
+            ["waterlogged=true" in key for key in self.palette], dtype=bool)
+        solid = ~np.isin(names, list(PASSABLE))
+        leaves = np.isin(names, list(lookup.LEAVES))
+        categories = {
+            "WORLD_SURFACE": ~np.isin(names, list(lookup.AIRS)),
+            "MOTION_BLOCKING": solid | fluid,
+            "MOTION_BLOCKING_NO_LEAVES": (solid | fluid) & ~leaves,
+            "OCEAN_FLOOR": solid & ~np.isin(names, list(lookup.LIQUIDS)),
+        }
+        part = self.blocks[i:i + x_size, :, k:k + z_size]
+        heightmaps = {}
+        for name, category in categories.items():
+            mask = category[part][:, ::-1, :]
+            heightmaps[name] = np.where(mask.any(axis=1), Y_SIZE - mask.argmax(axis=1), 0)
+        return heightmaps
+
+    def section(self, part: np.ndarray, biomes: np.ndarray) -> tuple[list, list]:
+        """
+        Entries of the block_states and biomes compounds of a chunk section.
+
+        Args:
+            part (np.ndarray): 16x16x16 palette ids, indexed by (x, y, z).
+            biomes (np.ndarray): 16x16 biome ids of the columns.
+        """
+        if part.min() == part.max():
+            ids, states = part.ravel()[:1], None
+        else:
+            ids, states = np.unique(part.transpose(1, 2, 0).ravel(), return_inverse=True)
+        palette = []
+        for index in ids:
+            block_id, properties = split_key(self.palette[index])
+            entries = [(TAG_STRING, "Name", nbt_string(block_id))]
+            if properties:
+                entries.append((TAG_COMPOUND, "Properties", nbt_compound(
+                    [(TAG_STRING, key, nbt_string(value)) for key, value in properties.items()])))
+            palette.append(nbt_compound(entries))
+        block_states = [(TAG_LIST, "palette", nbt_list(TAG_COMPOUND, palette))]
+        if len(ids) > 1:
+            block_states.append((TAG_LONG_ARRAY, "data", nbt_long_array(
+                pack_longs(states.ravel(), max(4, ceil(log2(len(ids))))))))
+
+        # Biomes are stored by cells of 4x4x4 blocks, the same for the four cell layers of a section.
+        cells = np.tile(biomes[::4, ::4].T.ravel(), 4)
+        ids, states = np.unique(cells, return_inverse=True)
+        biome_states = [(TAG_LIST, "palette", nbt_list(TAG_STRING, [nbt_string(self.biome_palette[index])
+                                                                    for index in ids]))]
+        if len(ids) > 1:
+            biome_states.append((TAG_LONG_ARRAY, "data", nbt_long_array(
+                pack_longs(states.ravel(), max(1, ceil(log2(len(ids))))))))
+        return block_states, biome_states
+
+    def chunks(self, chunk_x: int, chunk_z: int, dx: int = 1, dz: int = 1) -> bytes:
+        """
+        Uncompressed NBT of chunks, in the format the chunks endpoint answers and WorldSlice reads.
+        Chunks outside of the world are empty.
+
+        Args:
+            chunk_x, chunk_z (int): chunk coordinates of the first chunk.
+            dx, dz (int): number of chunks along each axis.
+        """
+        x_chunks, z_chunks = self.blocks.shape[0] // 16, self.blocks.shape[2] // 16
+        first_x, first_z = self.origin[0] // 16, self.origin[1] // 16
+        low_x, low_z = max(chunk_x - first_x, 0), max(chunk_z - first_z, 0)
+        high_x, high_z = min(chunk_x + dx - first_x, x_chunks), min(chunk_z + dz - first_z, z_chunks)
+        heightmaps = {}
+        if low_x < high_x and low_z < high_z:
+            heightmaps = self.heightmaps(low_x * 16, low_z * 16, (high_x - low_x) * 16, (high_z - low_z) * 16)
+
+        air = np.full((16, 16, 16), self.air, dtype=np.uint16)
+        plains = self.biome_palette.index("minecraft:plains") if "minecraft:plains" in self.biome_palette else None
+        chunks = []
+        for cz in range(chunk_z, chunk_z + dz):
+            for cx in range(chunk_x, chunk_x + dx):
+                i, k = cx - first_x, cz - first_z
+                inside = 0 <= i < x_chunks and 0 <= k < z_chunks
+                sections = []
+                for sy in range(Y_SIZE // 16):
+                    if inside:
+                        part = self.blocks[i * 16:i * 16 + 16, sy * 16:sy * 16 + 16, k * 16:k * 16 + 16]
+                        biomes = self.biomes[i * 16:i * 16 + 16, k * 16:k * 16 + 16]
+                    else:
+                        part = air
+                        if plains is None:
+                            plains = len(self.biome_palette)
+                            self.biome_palette.append("minecraft:plains")
+                        biomes = np.full((16, 16), plains)
+                    block_states, biome_states = self.section(part, biomes)
+                    sections.append(nbt_compound([
+                        (TAG_BYTE, "Y", struct.pack(">b", sy + Y_BEGIN // 16)),
+                        (TAG_COMPOUND, "block_states", nbt_compound(block_states)),
+                        (TAG_COMPOUND, "biomes", nbt_compound(biome_states)),
+                    ]))
+
+                chunk_heightmaps = []
+                for name in HEIGHTMAP_TYPES:
+                    values = np.zeros((16, 16), dtype=np.int64)
+                    if inside:
+                        x, z = (i - low_x) * 16, (k - low_z) * 16
+                        values = heightmaps[name][x:x + 16, z:z + 16]
+                    chunk_heightmaps.append((TAG_LONG_ARRAY, name, nbt_long_array(
+                        pack_longs(values.T.ravel(), max(1, ceil(log2(Y_SIZE)))))))
+
+                chunks.append(nbt_compound([
+                    (TAG_INT, "xPos", struct.pack(">i", cx)),
+                    (TAG_INT, "zPos", struct.pack(">i", cz)),
+                    (TAG_INT, "yPos", struct.pack(">i", Y_BEGIN // 16)),
+                    (TAG_STRING, "Status", nbt_string("minecraft:full")),
+                    (TAG_COMPOUND, "Heightmaps", nbt_compound(chunk_heightmaps)),
+                    (TAG_LIST, "sections", nbt_list(TAG_COMPOUND, sections)),
+                    (TAG_LIST, "block_entities", nbt_list(TAG_COMPOUND, [])),
+                ]))
+        return bytes((TAG_COMPOUND,)) + nbt_string("") + nbt_compound([(TAG_LIST, "Chunks", nbt_list(TAG_COMPOUND, chunks))])
+
+
+def span(start: int, delta: int) -> np.ndarray:
+    """
+    Coordinates covered by a position and a signed size, as the GDMC HTTP interface reads them.
+    """
+    if delta >= 0:
+        return np.arange(start, start + delta)
+    return np.arange(start + delta + 1, start + 1)
+
+
+class OfflineRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and the body are written separately: without it, kept alive connections wait for delayed acks.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body, status: int = 200, content_type: str = "application/json"):
+        if not isinstance(body, bytes):
+            body = (body if isinstance(body, str) else json.dumps(body, separators=(",", ":"))).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def body(self) -> str:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+
+    def parameters(self) -> tuple[str, dict]:
+        url = urlparse(self.path)
+        return url.path.rstrip("/"), {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def handle_request(self, handler):
+        server = self.server.offline
+        path, parameters = self.parameters()
+        try:
+            with server.lock:
+                server.requests += 1
+                handler(server, path, parameters)
+        except (KeyError, ValueError) as error:
+            self.reply(str(error), 400, "text/plain")
+
+    def do_GET(self):
+        self.handle_request(self.get)
+
+    def do_PUT(self):
+        self.handle_request(self.put)
+
+    def do_POST(self):
+        self.handle_request(self.post)
+
+    def get(self, server: "OfflineServer", path: str, parameters: dict):
+        world = server.world
+        if path == "/version":
+            self.reply(VERSION, content_type="text/plain")
+        elif path == "/buildarea":
+            keys = ("xFrom", "yFrom", "zFrom", "xTo", "yTo", "zTo")
+            self.reply(dict(zip(keys, world.build_area)))
+        elif path == "/chunks":
+            server.chunks += int(parameters.get("dx", 1)) * int(parameters.get("dz", 1))
+            self.reply(world.chunks(int(parameters["x"]), int(parameters["z"]),
+                                    int(parameters.get("dx", 1)), int(parameters.get("dz", 1))),
+                       content_type="application/octet-stream")
+        elif path in ("/blocks", "/biomes"):
+            x, y, z = np.meshgrid(*(span(int(parameters[axis]), int(parameters.get("d" + axis, 1)))
+                                    for axis in "xyz"), indexing="ij")
+            x, y, z = x.ravel(), y.ravel(), z.ravel()
+            if path == "/biomes":
+                self.reply([{"x": int(a), "y": int(b), "z": int(c), "id": name}
+                            for a, b, c, name in zip(x, y, z, world.get_biomes(x, z))])
+                return
+            server.read += len(x)
+            include_state = parameters.get("includeState", "false").lower() == "true"
+            blocks = []
+            for a, b, c, key in zip(x, y, z, world.get_blocks(x, y, z)):
+                block_id, states = split_key(key)
+                block = {"x": int(a), "y": int(b), "z": int(c), "id": block_id}
+                if include_state:
+                    block["state"] = states
+                blocks.append(block)
+            self.reply(blocks)
+        elif path == "/heightmap":
+            x_from, _, z_from, x_to, _, z_to = world.build_area
+            heightmap = world.heightmaps(x_from - world.origin[0], z_from - world.origin[1],
+                                         x_to - x_from + 1, z_to - z_from + 1)[parameters.get("type", "WORLD_SURFACE")]
+            self.reply((heightmap + Y_BEGIN).tolist())
+        elif path in ("/entities", "/players"):
+            self.reply([])
+        else:
+            self.reply(f"Unknown endpoint {path}", 404, "text/plain")
+
+    def put(self, server: "OfflineServer", path: str, parameters: dict):
+        if path != "/blocks":
+            self.reply(f"Unknown endpoint {path}", 404, "text/plain")
+            return
+        # One result per block, as gdpc reads them: an invalid block does not fail the others.
+        results, valid, positions, keys = [], [], [], []
+        for block in parse_blocks(self.body()):
+            try:
+                position = [int(block[axis]) for axis in "xyz"]
+                key = parse_block(block["id"], block.get("state"))
+            except (KeyError, TypeError, ValueError) as error:
+                results.append({"status": 0, "message": f"Invalid block: {error}"})
+                continue
+            valid.append(len(results))
+            results.append(None)
+            positions.append(position)
+            keys.append(key)
+        x, y, z = np.array(positions, dtype=np.int64).reshape(-1, 3).T
+        changed, inside = server.world.set_blocks(x, y, z, keys)
+        server.placed += int(changed.sum())
+        for index, c, i in zip(valid, changed.tolist(), inside.tolist()):
+            results[index] = {"status": int(c)} if i else {"status": 0,
+                                                           "message": "Position is outside of the offline world"}
+        self.reply(results)
+
+    def post(self, server: "OfflineServer", path: str, parameters: dict):
+        if path != "/command":
+            self.reply(f"Unknown endpoint {path}", 404, "text/plain")
+            return
+        results = []
+        for command in self.body().splitlines():
+            try:
+                count = server.run_command(command)
+                results.append({"status": 1, "message": f"Successfully changed {count} block(s)"})
+            except ValueError as error:
+                results.append({"status": 0, "message": str(error)})
+        self.reply(results)
+
+
+class OfflineServer:
+    """
+    HTTP server answering like the GDMC HTTP interface, from an OfflineWorld, in a background thread.
+    """
+
+    def __init__(self, world: OfflineWorld, host: str = "localhost", port: int = DEFAULT_PORT,
+                 save_path: str = None):
+        """
+        Args:
+            world (OfflineWorld): world to serve.
+            host (str): interface to listen on.
+            port (int): port to listen on, the one gdpc uses by default.
+            save_path (str): if given, the world is saved there when the server stops.
+        """
+        self.world = world
+        self.save_path = save_path
+        self.lock = threading.Lock()
+        self.requests = self.chunks = self.read = self.placed = self.filled = 0
+        self.http = ThreadingHTTPServer((host, port), OfflineRequestHandler)
+        self.http.daemon_threads = True
+        self.http.offline = self
+        self.thread = None
+
+    @classmethod
+    def from_environment(cls) -> "OfflineServer":
+        """
+        Start a server on the world named by GDMC_OFFLINE_WORLD, or return None if it is not set.
+        """
+        spec = os.environ.get(WORLD_ENV)
+        if not spec:
+            return None
+        print(f"[OfflineServer] Loading world {spec}")
+        return cls(OfflineWorld.from_spec(spec), save_path=os.environ.get(SAVE_ENV) or None).start()
+
+    def start(self) -> "OfflineServer":
+        self.thread = threading.Thread(target=self.http.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.http.server_address[:2]
+        print(f"[OfflineServer] Serving build area {self.world.build_area} on http://{host}:{port}")
+        return self
+
+    def stop(self):
+        """
+        Stop serving, print the traffic counters and save the world if a save path was given.
+        """
+        self.http.shutdown()
+        self.http.server_close()
+        print(f"[OfflineServer] {self.requests} requests, {self.chunks} chunks read, {self.read} blocks read, "
+              f"{self.placed} blocks placed, {self.filled} blocks filled")
+        if self.save_path:
+            self.world.save(self.save_path)
+            print(f"[OfflineServer] World saved in {self.save_path}")
+
+    def run_command(self, command: str) -> int:
+        """
+        Run a fill or setblock command with absolute coordinates.
+
+        Returns:
+            int: number of blocks changed.
+        """
+        tokens = command.strip().lstrip("/").split()
+        if not tokens:
+            raise ValueError("Empty command")
+        if tokens[0] not in ("fill", "setblock"):
+            raise ValueError(f"Unsupported command offline: {tokens[0]}")
+        corners = 2 if tokens[0] == "fill" else 1
+        if len(tokens) < 3 * corners + 2:
+            raise ValueError(f"Incomplete command: {command}")
+        if any(not re.fullmatch(r"-?\d+", token) for token in tokens[1:3 * corners + 1]):
+            raise ValueError("Only absolute coordinates are supported offline")
+        coordinates = [int(token) for token in tokens[1:3 * corners + 1]]
+        start, end = tuple(coordinates[:3]), tuple(coordinates[-3:])
+        key = parse_block(tokens[3 * corners + 1])
+        mode = tokens[3 * corners + 2] if len(tokens) > 3 * corners + 2 else "replace"
+        if mode not in ("replace", "destroy", "keep"):
+            raise ValueError(f"Unsupported fill mode offline: {mode}")
+        filter_key = None
+        if mode == "replace" and len(tokens) > 3 * corners + 3:
+            filter_key = parse_block(tokens[3 * corners + 3])
+        count = self.world.fill(start, end, key, mode, filter_key)
+        self.filled += count
+        return count
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    server = OfflineServer(OfflineWorld.from_spec(sys.argv[1] if len(sys.argv) > 1 else "synthetic"),
+                           port=int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT,
+                           save_path=os.environ.get(SAVE_ENV) or None).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
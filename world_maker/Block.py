@@ -12,6 +12,12 @@ class Block:
         self.neighbors = []
         self.surface = None
 
+    def __eq__(self, other):
+        # Blocks are rebuilt from the volume on each read, a block is identified by its position.
+        return isinstance(other, Block) and tuple(self.coordinates) == tuple(other.coordinates)
+
+    def __hash__(self):
+        return hash(tuple(self.coordinates))
 
     def addNeighbors(self, neighbors:list[Block]):
         for neighbor in neighbors:
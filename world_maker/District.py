@@ -1,7 +1,12 @@
+from collections import deque
 from world_maker.Position import Position
 from typing import Union
 from random import randint
 from PIL import Image
+import numpy as np
+
+
+NEIGHBORS = (Position(1, 0), Position(-1, 0), Position(0, 1), Position(0, -1))
 
 
 class Road:
@@ -24,7 +29,10 @@ class District:
         center_expend (Position): The center position from which the district expands.
         area (list): The list of positions that are part of the district.
         area_expend_from_point (list): The list of positions from which the district can expand.
-        area_expend (list): The list of positions to which the district will maybe expand.
+        area_expend (dict): The positions to which the district will maybe expand, in insertion order, as keys of a
+            dict for constant time lookups and removals.
+        roads_index (dict): The first road of roads at each position.
+        roads_expend_index (dict): The road of roads_expend at each position.
     """
 
     def __init__(self, tile_id: int, center: Position, district_type: str = ""):
@@ -41,9 +49,11 @@ class District:
         self.type = district_type
         self.center_expend = center
         self.area_expend_from_point = [center]
-        self.area_expend = []
+        self.area_expend: dict[Position, None] = {}
         self.roads: list[Road] = []
-        self.roads_expend = []
+        self.roads_expend: deque[Road] = deque()
+        self.roads_index: dict[Position, Road] = {}
+        self.roads_expend_index: dict[Position, Road] = {}
 
     def verify_point(self, point: Position, point_new: Position, map_data: list[list[int]],
                      height_map: list[list[int]]):
@@ -80,10 +90,24 @@ class District:
         :param position: The position to be checked.
         :return: True if the position is inside the district, False otherwise.
         """
-        for point in self.area_expend:
-            if point == position:
-                return True
-        return False
+        return position in self.area_expend
+
+    def add_expend_point(self, point: Position):
+        """
+        Add a position to the area to which the district will maybe expand, if it is not already inside.
+
+        :param point: The position to be added.
+        """
+        if point not in self.area_expend:
+            self.area_expend[point] = None
+
+    def remove_expend_point(self, point: Position):
+        """
+        Remove a position from the area to which the district will maybe expand.
+
+        :param point: The position to be removed.
+        """
+        del self.area_expend[point]
 
     def update_expend_points(self, point: Position, map_data: list[list[int]], height_map: list[list[int]]):
         """
@@ -93,10 +117,10 @@ class District:
         :param map_data: The 2D list representing the map.
         :param height_map: The 2D list representing the height map.
         """
-        for pos in [Position(1, 0), Position(-1, 0), Position(0, 1), Position(0, -1)]:
-            if self.verify_point(point, point + pos, map_data, height_map):
-                if not self.is_position_in_area_expend(point + pos):
-                    self.area_expend.append(point + pos)
+        for pos in NEIGHBORS:
+            point_new = point + pos
+            if self.verify_point(point, point_new, map_data, height_map):
+                self.add_expend_point(point_new)
         self.area_expend_from_point.remove(point)
 
     def move_point_to_area(self, point: Position, vector: Position, map_data) -> Position:
@@ -111,10 +135,7 @@ class District:
         :param point: The point to be checked.
         :return: The road that contains the point.
         """
-        for road in self.roads:
-            if point == road.position:
-                return road
-        return None
+        return self.roads_index.get(point)
 
     def get_road_expend_from_point(self, point: Position) -> Union[Road, None]:
         """
@@ -123,18 +144,39 @@ class District:
         :param point: The point to be checked.
         :return: The road that contains the point.
         """
-        for road in self.roads_expend:
-            if point == road.position:
-                return road
-        return None
+        return self.roads_expend_index.get(point)
+
+    def add_road(self, road: Road, expend: bool = False):
+        """
+        Add a road to the district and to the indexes.
+
+        :param road: The road to be added.
+        :param expend: If the road will be used to expand the grid.
+        """
+        self.roads.append(road)
+        self.roads_index.setdefault(road.position, road)
+        if expend:
+            self.roads_expend.append(road)
+            self.roads_expend_index[road.position] = road
+
+    def pop_road_expend(self) -> Road:
+        """
+        Get the next road from which the grid expands.
+        """
+        road = self.roads_expend.popleft()
+        del self.roads_expend_index[road.position]
+        return road
 
     def generate_roads(self, map_data, random_range=(40, 50)):
         width = {0: self.center_expend.x}
         height = {0: self.center_expend.y}
-        self.roads_expend = [Road(self.center_expend, 0, 0)]
-        self.roads = [self.roads_expend[0]]
+        self.roads = []
+        self.roads_expend = deque()
+        self.roads_index = {}
+        self.roads_expend_index = {}
+        self.add_road(Road(self.center_expend, 0, 0), True)
         while len(self.roads_expend) > 0:
-            road = self.roads_expend.pop(0)
+            road = self.pop_road_expend()
             for id_width in [-1, 1]:
                 if road.id_width + id_width not in width:
                     width[road.id_width + id_width] = width[road.id_width] + randint(random_range[0],
@@ -143,7 +185,6 @@ class District:
                                 road.id_height, road.id_width + id_width)
                 if self.is_point_inside(road_new.position, map_data):
                     road_search = self.get_road_from_point(road_new.position)
-                    road_expend_search = self.get_road_expend_from_point(road_new.position)
                     if road_search is not None:
                         road_new = road_search
 
@@ -155,12 +196,7 @@ class District:
                         road_new.west = road
 
                     if road_search is None:
-                        self.roads.append(road_new)
-                        self.roads_expend.append(road_new)
-                    else:
-                        self.roads[self.roads.index(road_search)] = road_new
-                        if road_expend_search is not None:
-                            self.roads_expend[self.roads_expend.index(road_expend_search)] = road_new
+                        self.add_road(road_new, True)
                 else:
                     point_new = self.move_point_to_area(road_new.position, Position(-id_width, 0), map_data)
                     road_new = Road(point_new, road.id_height, road.id_width + id_width, True)
@@ -170,7 +206,7 @@ class District:
                     else:
                         road.east = road_new
                         road_new.west = road
-                    self.roads.append(road_new)
+                    self.add_road(road_new)
 
             for id_height in [-1, 1]:
                 if road.id_height + id_height not in height:
@@ -180,7 +216,6 @@ class District:
                                 road.id_height + id_height, road.id_width)
                 if self.is_point_inside(road_new.position, map_data):
                     road_search = self.get_road_from_point(road_new.position)
-                    road_expend_search = self.get_road_expend_from_point(road_new.position)
                     if road_search is not None:
                         road_new = road_search
 
@@ -192,12 +227,7 @@ class District:
                         road_new.north = road
 
                     if road_search is None:
-                        self.roads.append(road_new)
-                        self.roads_expend.append(road_new)
-                    else:
-                        self.roads[self.roads.index(road_search)] = road_new
-                        if road_expend_search is not None:
-                            self.roads_expend[self.roads_expend.index(road_expend_search)] = road_new
+                        self.add_road(road_new, True)
                 else:
                     pass
                     point_new = self.move_point_to_area(road_new.position, Position(0, -id_height), map_data)
@@ -208,23 +238,37 @@ class District:
                     else:
                         road.south = road_new
                         road_new.north = road
-                    self.roads.append(road_new)
+                    self.add_road(road_new)
 
-    def draw_roads(self, image: Image, size: int = 1):
+    def draw_roads_mask(self, mask: np.ndarray, size: int = 1):
+        """
+        Draw the roads on a mask, with one slice assignment per road segment. Same pixels as drawing a square of
+        draw_square on each point of the segments.
+
+        :param mask: The 2D boolean array to draw on, indexed [y][x].
+        :param size: Half width of the roads.
+        """
+        height, width = mask.shape
         for road in self.roads:
-            image.putpixel((road.position.x, road.position.y), (255, 255, 255))
-            if road.north is not None:
-                for y in range(road.position.y, road.north.position.y):
-                    image = draw_square(image, Position(road.position.x, y), size)
-            if road.south is not None:
-                for y in range(road.position.y, road.south.position.y):
-                    image = draw_square(image, Position(road.position.x, y), size)
-            if road.east is not None:
-                for x in range(road.position.x, road.east.position.x):
-                    image = draw_square(image, Position(x, road.position.y), size)
-            if road.west is not None:
-                for x in range(road.position.x, road.west.position.x):
-                    image = draw_square(image, Position(x, road.position.y), size)
+            x, y = road.position.x, road.position.y
+            if 0 <= x < width and 0 <= y < height:
+                mask[y, x] = True
+            for neighbor, vertical in ((road.north, True), (road.south, True), (road.east, False), (road.west, False)):
+                if neighbor is None:
+                    continue
+                if vertical:
+                    x_min, x_max, y_min, y_max = x, x + 1, y, neighbor.position.y
+                else:
+                    x_min, x_max, y_min, y_max = x, neighbor.position.x, y, y + 1
+                if x_max <= x_min or y_max <= y_min:
+                    continue
+                mask[max(y_min - size, 0):max(y_max - 1 + size, 0),
+                     max(x_min - size, 0):max(x_max - 1 + size, 0)] = True
+
+    def draw_roads(self, image: Image, size: int = 1):
+        mask = np.zeros((image.height, image.width), dtype=bool)
+        self.draw_roads_mask(mask, size)
+        image.paste((255, 255, 255), mask=Image.fromarray(mask))
 
 
 def draw_square(image, center: Position, size: int) -> Image:
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+DATA_DIRECTORY = './world_maker/data/'
+
+
+class MapRegistry:
+    """
+    In-memory store of the maps of the generation, kept as named arrays (layers) instead of PNG files.
+    A layer can be referred to by its name ('heightmap') or by its path in the data directory
+    ('./world_maker/data/heightmap.png'), so paths used across the generator are served from memory.
+
+    Attributes:
+        directory (str): The directory the layers are dumped to.
+        layers (dict): The arrays of the layers, indexed by name.
+    """
+
+    def __init__(self, directory: str = DATA_DIRECTORY):
+        """
+        The constructor for the MapRegistry class.
+
+        :param directory: The directory the layers are dumped to.
+        """
+        self.directory = directory
+        self.layers: dict[str, np.ndarray] = {}
+
+    def name(self, key: str) -> str | None:
+        """
+        Get the layer name of a layer name or of a path in the data directory.
+
+        :param key: Name or path of the layer.
+        :return: The layer name, None if the path is outside of the data directory.
+        """
+        if key in self.layers:
+            return key
+        directory, file = os.path.split(os.path.normpath(key))
+        name, extension = os.path.splitext(file)
+        if extension == '':
+            return key if directory == '' else None
+        if extension == '.png' and directory == os.path.normpath(self.directory):
+            return name
+        return None
+
+    def __contains__(self, key: str) -> bool:
+        return self.name(key) in self.layers
+
+    def set(self, key: str, image: Image.Image | np.ndarray) -> Image.Image | np.ndarray:
+        """
+        Store a layer. The stored array is read only, the readers get a copy when they convert it.
+
+        :param key: Name or path of the layer.
+        :param image: Image or array of the layer.
+        :return: The image given, to chain calls.
+        """
+        name = self.name(key)
+        if name is None:
+            raise ValueError(f"{key} is not a layer name or a path in {self.directory}")
+        array = np.array(image)
+        array.flags.writeable = False
+        self.layers[name] = array
+        return image
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Get the array of a layer.
+
+        :param key: Name or path of the layer.
+        :return: The read only array of the layer, None if it is not stored.
+        """
+        return self.layers.get(self.name(key))
+
+    def open(self, key: str) -> Image.Image:
+        """
+        Get a layer as an image, from memory if it is stored, else from the disk.
+
+        :param key: Name or path of the layer.
+        :return: The image of the layer.
+        """
+        array = self.get(key)
+        if array is not None:
+            return Image.fromarray(array)
+        return Image.open(key)
+
+    def dump(self, names: list[str] = None):
+        """
+        Write layers as PNG in the data directory, for debugging.
+
+        :param names: The layers to write, all of them by default.
+        """
+        for name in (self.layers if names is None else names):
+            Image.fromarray(self.layers[name]).save(os.path.join(self.directory, name + '.png'))
+        print(f"[Maps] {len(self.layers) if names is None else len(names)} maps written in {self.directory}.")
+
+    def clear(self):
+        self.layers.clear()
+
+
+maps = MapRegistry()
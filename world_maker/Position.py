@@ -2,9 +2,24 @@ from math import sqrt, atan2
 
 
 class Position:
+    """
+    Immutable 2D point, usable as a set element or a dict key.
+    """
+
+    __slots__ = ("x", "y")
+
     def __init__(self, x: int = 0, y: int = 0):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, "x", x)
+        object.__setattr__(self, "y", y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Position is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Position is immutable")
+
+    def __reduce__(self):
+        return Position, (self.x, self.y)
 
     def __add__(self, other: "Position") -> "Position":
         return Position(self.x + other.x, self.y + other.y)
@@ -21,9 +36,17 @@ class Position:
     def __str__(self):
         return f"({self.x}, {self.y})"
 
+    def __repr__(self):
+        return f"Position({self.x}, {self.y})"
+
     def __eq__(self, other: "Position"):
+        if not isinstance(other, Position):
+            return NotImplemented
         return self.x == other.x and self.y == other.y
 
+    def __hash__(self):
+        return hash((self.x, self.y))
+
     def get_tuple(self) -> tuple[int, int]:
         return self.x, self.y
 
@@ -1,53 +1,99 @@
 import random
 from collections import Counter
+from math import sqrt
 from typing import List, Union
 
 import numpy as np
 from gdpc import Editor
-from PIL import Image, ImageDraw
+from PIL import Image
 from skan.csr import skeleton_to_csgraph
 from skimage.morphology import skeletonize
-from networks.geometry.Point3D import Point3D
+from networks.geometry.curve_tools import simplify_polyline, rdp_indices
+from world_maker.MapRegistry import maps
 
 
 def handle_import_image(image: Union[str, Image.Image]) -> Image.Image:
     if isinstance(image, str):
-        return Image.open(image)
+        return maps.open(image)
     return image
 
 
 def simplify_coordinates(coordinates, epsilon):
-    if len(coordinates) < 3:
-        return coordinates
-
-    # Find the point with the maximum distance
-    max_distance = 0
-    max_index = 0
-    end_index = len(coordinates) - 1
-
-    for i in range(1, end_index):
-        distance = Point3D(coordinates[i][0], coordinates[i][1], coordinates[i][2]).distance(
-            Point3D(coordinates[0][0], coordinates[0][1], coordinates[0][2]))
-        if distance > max_distance:
-            max_distance = distance
-            max_index = i
-
-    simplified_coordinates = []
-
-    # If the maximum distance is greater than epsilon, recursively simplify
-    if max_distance > epsilon:
-        rec_results1 = simplify_coordinates(coordinates[:max_index+1], epsilon)
-        rec_results2 = simplify_coordinates(coordinates[max_index:], epsilon)
-
-        # Combine the simplified sub-results
-        simplified_coordinates.extend(rec_results1[:-1])
-        simplified_coordinates.extend(rec_results2)
-    else:
-        # The maximum distance is less than epsilon, retain the endpoints
-        simplified_coordinates.append(coordinates[0])
-        simplified_coordinates.append(coordinates[end_index])
-
-    return simplified_coordinates
+    return simplify_polyline(coordinates, epsilon)
+
+
+def remove_close_points(points: np.ndarray, spacing: float, verbose: int = 0) -> np.ndarray:
+    """
+    Walk along the line and remove the next point when it is at a distance of at most spacing, then go on from the
+    point after it. In a run of close points, one point out of two is removed.
+
+    :param points: N x 3 array of the points of the line.
+    :param spacing: The minimum distance between two consecutive points.
+    :param verbose: 2 to print the removed points.
+    :return: The remaining points.
+    """
+    if len(points) < 2:
+        return points
+    distances = np.linalg.norm(np.diff(points, axis=0).astype(np.float64), axis=1)
+    close = distances <= spacing
+    pairs = np.arange(len(close))
+    # Index of the first pair of the run of close pairs each pair is in.
+    run_start = np.maximum.accumulate(np.where(close & ~np.r_[False, close[:-1]], pairs, 0))
+    removed = close & ((pairs - run_start) % 2 == 0)
+    if verbose >= 2:
+        for pair in np.flatnonzero(removed):
+            print(f"[Skeleton] Remove point {points[pair + 1].tolist()}, at {distances[pair]} of "
+                  f"{points[pair].tolist()}")
+    return points[np.r_[True, ~removed]]
+
+
+def prepare_road(points, epsilon: float = 20, spacings: tuple = (20, 10, 10), verbose: int = 1) -> np.ndarray:
+    """
+    Prepare a road line: Ramer-Douglas-Peucker simplification, then removal of the points too close to the previous
+    one, once per spacing.
+
+    :param points: N x 3 world coordinates of the line.
+    :param epsilon: The maximum distance between the removed points and the simplified line.
+    :param spacings: The minimum distance between consecutive points of each removal pass.
+    :param verbose: 0 to print nothing, 1 to print the number of points, 2 to also print each removed point.
+    :return: The points of the road.
+    """
+    points = np.asarray(points)
+    if verbose >= 1:
+        print(f"[Skeleton] Number of points: {len(points)}")
+    if len(points) >= 3:
+        points = points[rdp_indices(points.astype(np.float64), epsilon)]
+    for spacing in spacings:
+        points = remove_close_points(points, spacing, verbose)
+    if verbose >= 1:
+        print(f"[Skeleton] Number of points after simplification: {len(points)}")
+    return points
+
+
+def dilate_disk(mask: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Get the pixels at a euclidean distance of at most radius from the mask, as
+    ndimage.distance_transform_edt(~mask) <= radius, without computing the distances: the disk is made of one
+    horizontal dilation of the mask per row, shifted vertically.
+
+    :param mask: The 2D boolean array to dilate.
+    :param radius: The radius of the disk.
+    :return: The dilated mask.
+    """
+    height, width = mask.shape
+    result = np.zeros((height, width), dtype=bool)
+    row = mask.astype(bool)
+    half_width = 0
+    # From the top of the disk to its middle, the rows get wider.
+    for dy in range(int(radius), -1, -1):
+        while half_width < min(int(sqrt(radius ** 2 - dy ** 2)), width - 1):
+            half_width += 1
+            row[:, half_width:] |= mask[:, :width - half_width]
+            row[:, :width - half_width] |= mask[:, half_width:]
+        if dy < height:
+            result[dy:] |= row[:height - dy]
+            result[:height - dy] |= row[dy:]
+    return result
 
 
 class Skeleton:
@@ -57,6 +103,8 @@ class Skeleton:
         self.centers = []
         self.coordinates = []
         self.graph = None
+        self.indptr = None
+        self.indices = None
         if data is not None:
             self.set_skeleton(data)
 
@@ -65,7 +113,12 @@ class Skeleton:
         binary_skeleton = skeletonize(data, method="lee")
 
         graph, coordinates = skeleton_to_csgraph(binary_skeleton)
+        graph = graph.tocsr()
         self.graph = graph.tocoo()
+        # Adjacency index: the neighbors of a node are indices[indptr[node]:indptr[node + 1]], in the same order
+        # as in the rows of the COO graph.
+        self.indptr = graph.indptr
+        self.indices = graph.indices
 
         # List of lists. Inverted coordinates.
         coordinates = list(coordinates)
@@ -82,16 +135,7 @@ class Skeleton:
 
     def find_next_elements(self, key: str) -> list:
         """Find the very nearest elements"""
-
-        line = []
-
-        values = np.array(self.graph.row)
-        indices = np.where(values == key)[0]
-
-        for i in range(len(indices)):
-            if self.graph.row[indices[i]] == key:
-                line.append(self.graph.col[indices[i]])
-        return line
+        return self.indices[self.indptr[key]:self.indptr[key + 1]].tolist()
 
     def find_line(self, key: str):
         next_keys = self.find_next_elements(key)
@@ -130,6 +174,71 @@ class Skeleton:
                             next_keys.append(key)
             return line
 
+    def walk_branch(self, previous: int, key: int, visited: np.ndarray) -> list:
+        """
+        Follow a branch from an edge until a node which is not in the middle of a line (intersection or endpoint).
+        The nodes in the middle of the line are marked as visited.
+
+        :param previous: The node the branch starts from.
+        :param key: The next node of the branch.
+        :param visited: The visited flags of the nodes, updated in place.
+        :return: The nodes of the branch in path order, from previous to the last node.
+        """
+        line = [previous, key]
+        while self.indptr[key + 1] - self.indptr[key] == 2 and not visited[key]:
+            visited[key] = True
+            first, second = self.indices[self.indptr[key]:self.indptr[key + 1]]
+            previous, key = key, int(second if first == previous else first)
+            line.append(key)
+        return line
+
+    def parse_branches(self, parse_orphan: bool = False):
+        """
+        Same decomposition as parse_graph, in linear time: each branch is walked once from its intersection, and
+        the lines are deduplicated with a hash of their nodes. The nodes of each line are in path order, and each
+        node is listed once: a loop from an intersection back to itself starts at the intersection but does not end
+        with it again.
+
+        :param parse_orphan: Also add the lines which are not connected to any intersection (paths between two
+        endpoints and loops).
+        """
+        print("[Skeleton] Start parsing the branches",
+              ("with orphans" if parse_orphan else "") + "...")
+        degrees = np.diff(self.indptr)
+        visited = np.zeros(len(degrees), dtype=bool)
+        known = set()
+
+        def add_line(line):
+            key = frozenset(line)
+            if key not in known:
+                known.add(key)
+                self.lines.append(line)
+
+        # Biggest intersections first, as in parse_graph.
+        nodes = np.flatnonzero(degrees)
+        for key in nodes[np.argsort(-degrees[nodes], kind='stable')].tolist():
+            if degrees[key] >= 3:
+                neighbors = self.find_next_elements(key)
+                self.centers.append(key)
+                self.intersections.append(neighbors)
+                for neighbor in neighbors:
+                    if not visited[neighbor]:
+                        line = self.walk_branch(key, neighbor, visited)
+                        if len(line) > 2 and line[-1] == key:
+                            # Loop back to the intersection, which is already the first node.
+                            line.pop()
+                        add_line(line)
+            elif degrees[key] == 2 and parse_orphan and not visited[key]:
+                visited[key] = True
+                first, second = self.find_next_elements(key)
+                backward = self.walk_branch(key, first, visited)
+                if backward[-1] == key:
+                    # Loop : the walk went all around.
+                    add_line(backward[:-1])
+                else:
+                    add_line(backward[:0:-1] + self.walk_branch(key, second, visited))
+        print("[Skeleton] Branches parsing completed.")
+
     def parse_graph(self, parse_orphan: bool = False):
         print("[Skeleton] Start parsing the graph",
               ("with orphans" if parse_orphan else "") + "...")
@@ -186,6 +295,16 @@ class Skeleton:
                     self.lines.append(line)
         print("[Skeleton] Graph parsing completed.")
 
+    def pixels(self, keys) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Get the pixels of skeleton nodes on the 2D maps.
+
+        :param keys: The nodes.
+        :return: The rows (x of the coordinates) and the columns (z of the coordinates) of the pixels.
+        """
+        coordinates = np.asarray(self.coordinates).reshape(-1, 3)[np.asarray(keys, dtype=np.intp)]
+        return coordinates[:, 2].astype(np.intp), coordinates[:, 0].astype(np.intp)
+
     def map(self) -> Image:
         """
 
@@ -195,97 +314,43 @@ class Skeleton:
             image: 2D path of the skeleton on top of the heightmap.
         """
         print("[Skeleton] Start mapping the skeleton...")
-        # editor = Editor()
-
-        # buildArea = editor.getBuildArea()
-        # buildRect = buildArea.toRect()
-        # xzStart = buildRect.begin
-        # xzDistance = (max(buildRect.end[0], buildRect.begin[0]) - min(buildRect.end[0], buildRect.begin[0]),
-        #              max(buildRect.end[1], buildRect.begin[1]) - min(buildRect.end[1], buildRect.begin[1]))
-
-        heightmap = Image.open(
-            "./world_maker/data/heightmap.png").convert('RGB')
-        # roadsArea = Image.new("L", xzDistance, 0)
-        # width, height = heightmap.size
-
-        # Lines
-        for i in range(len(self.lines)):
-            r, g, b = (random.randint(0, 255), random.randint(
-                0, 255), random.randint(0, 255))
-
-            for j in range(len(self.lines[i])):
-                z = self.coordinates[self.lines[i][j]][0]
-                # y = self.coordinates[self.lines[i][j]][1]
-                x = self.coordinates[self.lines[i][j]][2]
-
-                heightmap.putpixel(
-                    (
-                        int(z),
-                        int(x),
-                    ),
-                    (r + j, g + j, b + j),
-                )
-
-                # roadsArea.putpixel(
-                #    (
-                #        int(z),
-                #        int(x),
-                #    ),
-                #    (255),
-                # )
-
+        heightmap = np.array(handle_import_image(
+            "./world_maker/data/heightmap.png").convert('RGB'))
+
+        # Lines: the color of each line is lighter along the line, the last line drawn on a pixel is kept.
+        keys, colors = [], []
+        for line in self.lines:
+            color = np.array((random.randint(0, 255), random.randint(
+                0, 255), random.randint(0, 255)))
+            keys.extend(line)
+            colors.append(np.clip(color + np.arange(len(line))[:, None], 0, 255))
         # Centers
-        for i in range(len(self.centers)):
-            # print(self.coordinates[self.centers[i]])
-            heightmap.putpixel(
-                (int(self.coordinates[self.centers[i]][0]), int(
-                    self.coordinates[self.centers[i]][2])),
-                (255, 255, 0),
-            )
-
-            # roadsArea.putpixel(
-            #    (int(self.coordinates[self.centers[i]][0]), int(self.coordinates[self.centers[i]][2])),
-            #    (255),
-            # )
-
-        # # Intersections
-        # for i in range(len(self.intersections)):
-        #     intersection = []
-        #     for j in range(len(self.intersections[i])):
-        #         intersection.append(self.coordinates[self.intersections[i][j]])
-
-        #     for i in range(len(intersection)):
-        #         heightmap.putpixel(
-        #             (int(self.intersections[i][2]), int(self.intersections[i][0])),
-        #             (255, 0, 255),
-        #         )
+        keys.extend(self.centers)
+        colors.append(np.tile((255, 255, 0), (len(self.centers), 1)))
+
+        if len(keys) > 0:
+            rows, columns = self.pixels(keys)
+            pixels = np.ravel_multi_index((rows, columns), heightmap.shape[:2])
+            _, last = np.unique(pixels[::-1], return_index=True)
+            last = len(pixels) - 1 - last
+            heightmap.reshape(-1, 3)[pixels[last]] = np.concatenate(colors)[last]
+
         print("[Skeleton] Mapping completed.")
-        return heightmap  # , roadsArea
+        return Image.fromarray(heightmap)
 
     def road_area(self, name: str, radius: int = 10) -> Image:
         print("[Skeleton] Start mapping the road area...")
-        heightmap = Image.open("./world_maker/data/heightmap.png")
-        width, height = heightmap.size
-        road_area_map = Image.new("L", (width, height), 0)
-        road_area_map_draw = ImageDraw.Draw(road_area_map)
-
-        # Lines
-        for i in range(len(self.lines)):
-            for j in range(len(self.lines[i])):
-                z = self.coordinates[self.lines[i][j]][0]
-                x = self.coordinates[self.lines[i][j]][2]
-                circle_coords = (z - radius, x - radius,
-                                 z + radius, x + radius)
-                road_area_map_draw.ellipse(circle_coords, fill=255)
+        width, height = handle_import_image("./world_maker/data/heightmap.png").size
 
-        # Centers
-        for i in range(len(self.centers)):
-            z = self.coordinates[self.centers[i]][0]
-            x = self.coordinates[self.centers[i]][2]
-            circle_coords = (z - radius, x - radius, z + radius, x + radius)
-            road_area_map_draw.ellipse(circle_coords, fill=255)
+        # Pixels at a distance of at most radius from the lines or the centers.
+        road_area_array = np.zeros((height, width), dtype=bool)
+        keys = [key for line in self.lines for key in line] + list(self.centers)
+        if len(keys) > 0:
+            road_area_array[self.pixels(keys)] = True
+        road_area_array = dilate_disk(road_area_array, radius)
+        road_area_map = Image.fromarray(road_area_array.astype(np.uint8) * 255)
 
-        road_area_map.save("./world_maker/data/"+name)
+        maps.set("./world_maker/data/"+name, road_area_map)
 
         print("[Skeleton] Road area mapping completed.")
         return road_area_map
@@ -0,0 +1,137 @@
+import numpy as np
+
+CHUNK_SIZE = 16
+
+
+class Volume:
+    """
+    Sparse voxel store. The volume is cut in 16x16x16 chunks of uint16 palette indices, each chunk having its own
+    palette and being allocated on the first write, so memory scales with the touched chunks and not the bounding box.
+
+    Attributes:
+        size (tuple): The size of the volume on each axis.
+        chunks (dict): The allocated chunks, indexed by chunk coordinates.
+        palettes (dict): The palette of each chunk. Index 0 is reserved for empty voxels.
+    """
+
+    def __init__(self, size: tuple[int, int, int]):
+        """
+        The constructor for the Volume class.
+
+        :param size: The size of the volume on each axis.
+        """
+        self.size = tuple(size)
+        self.chunks: dict[tuple[int, int, int], np.ndarray] = {}
+        self.palettes: dict[tuple[int, int, int], list] = {}
+        self.palettes_index: dict[tuple[int, int, int], dict[str, int]] = {}
+        self.counts: dict[tuple[int, int, int], int] = {}
+
+    def is_inside(self, coordinates) -> bool:
+        return all(0 <= coordinates[i] < self.size[i] for i in range(3))
+
+    def get_chunk(self, key: tuple[int, int, int]) -> np.ndarray:
+        """
+        Get a chunk, allocating it if it doesn't exist yet.
+
+        :param key: The chunk coordinates.
+        :return: The array of palette indices of the chunk.
+        """
+        if key not in self.chunks:
+            self.chunks[key] = np.zeros((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE), dtype=np.uint16)
+            self.palettes[key] = [None]
+            self.palettes_index[key] = {}
+            self.counts[key] = 0
+        return self.chunks[key]
+
+    def get_palette_index(self, key: tuple[int, int, int], value) -> int:
+        """
+        Get the index of a value in the palette of a chunk, adding it if needed.
+        """
+        index = self.palettes_index[key].get(str(value))
+        if index is None:
+            index = len(self.palettes[key])
+            self.palettes[key].append(value)
+            self.palettes_index[key][str(value)] = index
+        return index
+
+    def free_chunk(self, key: tuple[int, int, int]):
+        del self.chunks[key]
+        del self.palettes[key]
+        del self.palettes_index[key]
+        del self.counts[key]
+
+    def __getitem__(self, coordinates):
+        key = (coordinates[0] // CHUNK_SIZE, coordinates[1] // CHUNK_SIZE, coordinates[2] // CHUNK_SIZE)
+        if key not in self.chunks:
+            return None
+        index = self.chunks[key][coordinates[0] % CHUNK_SIZE, coordinates[1] % CHUNK_SIZE, coordinates[2] % CHUNK_SIZE]
+        return self.palettes[key][index]
+
+    def __setitem__(self, coordinates, value):
+        if value is None:
+            del self[coordinates]
+            return
+        key = (coordinates[0] // CHUNK_SIZE, coordinates[1] // CHUNK_SIZE, coordinates[2] // CHUNK_SIZE)
+        chunk = self.get_chunk(key)
+        local = (coordinates[0] % CHUNK_SIZE, coordinates[1] % CHUNK_SIZE, coordinates[2] % CHUNK_SIZE)
+        if chunk[local] == 0:
+            self.counts[key] += 1
+        chunk[local] = self.get_palette_index(key, value)
+
+    def __delitem__(self, coordinates):
+        key = (coordinates[0] // CHUNK_SIZE, coordinates[1] // CHUNK_SIZE, coordinates[2] // CHUNK_SIZE)
+        if key not in self.chunks:
+            return
+        chunk = self.chunks[key]
+        local = (coordinates[0] % CHUNK_SIZE, coordinates[1] % CHUNK_SIZE, coordinates[2] % CHUNK_SIZE)
+        if chunk[local] != 0:
+            chunk[local] = 0
+            self.counts[key] -= 1
+            if self.counts[key] == 0:
+                self.free_chunk(key)
+
+    def set_many(self, coordinates: np.ndarray, indices: np.ndarray, palette: list):
+        """
+        Set a lot of voxels at once, chunk by chunk.
+
+        :param coordinates: (N, 3) array of coordinates inside the volume.
+        :param indices: (N,) array of indices in the palette, the value of each voxel.
+        :param palette: The values referenced by indices.
+        """
+        coordinates = np.asarray(coordinates, dtype=np.int64).reshape(-1, 3)
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        if len(coordinates) == 0:
+            return
+
+        keys, inverse = np.unique(coordinates // CHUNK_SIZE, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(inverse))[:-1])
+
+        for key, group in zip(keys, groups):
+            key = tuple(int(k) for k in key)
+            chunk = self.get_chunk(key)
+            used = np.unique(indices[group])
+            lookup = np.zeros(len(palette), dtype=np.uint16)
+            for index in used:
+                lookup[index] = self.get_palette_index(key, palette[index])
+            local = coordinates[group] % CHUNK_SIZE
+            chunk[local[:, 0], local[:, 1], local[:, 2]] = lookup[indices[group]]
+            self.counts[key] = int(np.count_nonzero(chunk))
+
+    def to_binary_image(self) -> np.ndarray:
+        """
+        Convert the volume to a 3D boolean array, True where a voxel is set.
+        """
+        image = np.zeros(self.size, dtype=bool)
+        for (cx, cy, cz), chunk in self.chunks.items():
+            x, y, z = cx * CHUNK_SIZE, cy * CHUNK_SIZE, cz * CHUNK_SIZE
+            part = image[x:x + CHUNK_SIZE, y:y + CHUNK_SIZE, z:z + CHUNK_SIZE]
+            part[...] = chunk[:part.shape[0], :part.shape[1], :part.shape[2]] != 0
+        return image
+
+    def memory_size(self) -> int:
+        """
+        Get the number of bytes used by the chunk arrays.
+        """
+        return sum(chunk.nbytes for chunk in self.chunks.values())
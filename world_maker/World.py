@@ -1,7 +1,16 @@
-from gdpc import Editor, geometry, lookup
+from collections import deque
+
+from gdpc import geometry, lookup
+from gdpc.block import Block as GdpcBlock
+from gdpc.vector_tools import Rect
+from glm import ivec3
 import numpy as np
 from PIL import Image
+from scipy import ndimage
 from world_maker.Block import Block
+from world_maker.Volume import Volume
+from world_maker.MapRegistry import maps
+from utils.EditorSession import EditorSession, get_session
 
 waterBiomes = [
     "minecraft:ocean",
@@ -22,13 +31,111 @@ waterBlocks = [
     "minecraft:water",
 ]
 
+# Side, in chunks, of the world slices loaded by the block read cache.
+SLICE_CACHE_CHUNKS = 4
+
+NEIGHBORS_KERNEL = np.array([[1, 1, 1],
+                             [1, 0, 1],
+                             [1, 1, 1]])
+
+
+def unpackBitArray(bitArray) -> np.ndarray:
+    """
+    Decode a gdpc packed long array (chunk section block states or biomes) into palette indices.
+    """
+    if len(bitArray.longArray) == 0:
+        # Single value palette, no data stored.
+        return np.zeros(len(bitArray), dtype=np.int64)
+    longs = np.array(list(bitArray.longArray), dtype=np.int64).view(np.uint64)
+    shifts = np.arange(bitArray._entriesPerLong, dtype=np.uint64) * np.uint64(bitArray._bitsPerEntry)
+    values = (longs[:, None] >> shifts[None, :]) & np.uint64(bitArray._maxEntryValue)
+    return values.reshape(-1)[:len(bitArray)].astype(np.int64)
+
+
+def blockId(tag, names: dict[str, int], blocks: dict[int, GdpcBlock] = None) -> int:
+    """
+    Get the id of a block of a chunk palette in the names table.
+
+    Args:
+        tag (TAG_Compound): block state tag of the palette.
+        names (dict): id table, filled with the name if it is new.
+        blocks (dict): if given, the block is named with its states and its Block is stored with its id.
+    """
+    if blocks is None:
+        return names.setdefault(str(tag["Name"]), len(names))
+    block = GdpcBlock.fromBlockStateTag(tag)
+    index = names.setdefault(str(block), len(names))
+    blocks.setdefault(index, block)
+    return index
+
+
+def sliceSurface(slice, heights: np.ndarray, names: dict[str, int], sections: dict,
+                 blocks: dict[int, GdpcBlock] = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the block and the biome of one block per column of a world slice, chunk section by chunk section.
+
+    Args:
+        slice (WorldSlice): loaded slice of the world.
+        heights (np.ndarray): local y of the block to read for each (x, z) column.
+        names (dict): id table shared between calls, filled with every block or biome name met.
+        sections (dict): cache of the decoded chunk sections shared between calls.
+        blocks (dict): if given, the blocks are named with their states, and this table is filled with the Block of
+            each block id. The sections cache must not be shared with calls without it.
+
+    Returns:
+        blocks, biomes: arrays of ids from the names table, same shape as heights.
+    """
+    x, z = np.indices(heights.shape)
+    x = x.ravel() + slice.rect.offset[0]
+    y = heights.ravel().astype(np.int64)
+    z = z.ravel() + slice.rect.offset[1]
+
+    keys = np.stack(((x >> 4) - slice.chunkRect.offset[0], y >> 4, (z >> 4) - slice.chunkRect.offset[1]), axis=1)
+    unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+    order = np.argsort(inverse.ravel(), kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(inverse.ravel()))[:-1])
+
+    blockIds = np.empty(len(y), dtype=np.int64)
+    biomes = np.empty(len(y), dtype=np.int64)
+    for key, group in zip(unique_keys, groups):
+        key = tuple(int(k) for k in key)
+        if key not in sections:
+            section = slice._sections.get(ivec3(*key))
+            if section is None:
+                sections[key] = None
+            else:
+                sections[key] = (
+                    unpackBitArray(section.blockStatesBitArray),
+                    np.array([blockId(tag, names, blocks) for tag in section.blockPalette]),
+                    unpackBitArray(section.biomesBitArray),
+                    np.array([names.setdefault(str(tag.value), len(names)) for tag in section.biomesPalette]))
+
+        if sections[key] is None:
+            blockIds[group] = names.setdefault("minecraft:void_air", len(names))
+            if blocks is not None:
+                blocks.setdefault(int(blockIds[group[0]]), GdpcBlock("minecraft:void_air"))
+            biomes[group] = names.setdefault("", len(names))
+            continue
+
+        block_states, block_palette, biome_states, biome_palette = sections[key]
+        gx, gy, gz = x[group] % 16, y[group] % 16, z[group] % 16
+        blockIds[group] = block_palette[block_states[gy * 256 + gz * 16 + gx]]
+        biomes[group] = biome_palette[biome_states[((gy >> 2) << 4) | ((gz >> 2) << 2) | (gx >> 2)]]
+
+    return blockIds.reshape(heights.shape), biomes.reshape(heights.shape)
+
 
 class World:
-    def __init__(self):
+    def __init__(self, session: EditorSession = None):
+        """
+        Args:
+            session (EditorSession): session to read the world with, the default one if None.
+        """
         print("World init")
-        editor = Editor(buffering=True)
+        self.session = session if session is not None else get_session()
+        self.editor = self.session.editor
         print("Editor init")
-        buildArea = editor.getBuildArea()
+        buildArea = self.session.build_area
         print("BuildArea init")
         print(buildArea.begin[0], buildArea.begin[1], buildArea.begin[2])
         self.coordinates_min = [min(buildArea.begin[i], buildArea.last[i]) for i in range(3)]
@@ -39,8 +146,8 @@ class World:
         self.length_y = self.coordinates_max[1] - self.coordinates_min[1] + 1
         self.length_z = self.coordinates_max[2] - self.coordinates_min[2] + 1
         print("getting colume")
-        self.volume = [[[None for _ in range(self.length_z)] for _ in range(self.length_y)] for _ in
-                       range(self.length_x)]
+        self.volume = Volume((self.length_x, self.length_y, self.length_z))
+        self.slices = {}
         print("Volume init")
 
     def isInVolume(self, coordinates):
@@ -57,32 +164,45 @@ class World:
 
         for block in blocks:
             if self.isInVolume(block.coordinates):
-                self.volume[block.coordinates[0] - self.coordinates_min[0]][
-                    block.coordinates[1] - self.coordinates_min[1]][
-                    block.coordinates[2] - self.coordinates_min[2]] = block
+                self.volume[self.toVolumeCoordinates(block.coordinates)] = block.name
 
     def removeBlock(self, volumeCoordinates):
         """
-        Add block or list of block to the volume.
+        Remove a block from the volume.
         """
 
-        self.volume[volumeCoordinates[0]][volumeCoordinates[1]][volumeCoordinates[2]] = None
+        del self.volume[volumeCoordinates]
+
+    def toVolumeCoordinates(self, coordinates):
+        return (coordinates[0] - self.coordinates_min[0], coordinates[1] - self.coordinates_min[1],
+                coordinates[2] - self.coordinates_min[2])
 
     def getBlockFromCoordinates(self, coordinates):
         """
         Use already created volume to get block data.
         """
 
-        editor = Editor(buffering=True)
-        if self.volume[coordinates[0] - self.coordinates_min[0]][coordinates[1] - self.coordinates_min[1]][
-            coordinates[2] - self.coordinates_min[2]] == None:
-            self.volume[coordinates[0] - self.coordinates_min[0]][coordinates[1] - self.coordinates_min[1]][
-                coordinates[2] - self.coordinates_min[2]] = Block((coordinates[0], coordinates[1], coordinates[2]),
-                                                                  editor.getBlock((coordinates[0], coordinates[1],
-                                                                                   coordinates[2])).id)
+        volumeCoordinates = self.toVolumeCoordinates(coordinates)
+        if self.volume[volumeCoordinates] == None:
+            self.volume[volumeCoordinates] = self.readBlockName(coordinates)
+
+        return Block((coordinates[0], coordinates[1], coordinates[2]), self.volume[volumeCoordinates])
+
+    def readBlockName(self, coordinates) -> str:
+        """
+        Read the id of a block in the world, loading the world slice around it on the first miss.
+        The slices are cached, so the next reads of the area don't need any request.
+        """
 
-        return self.volume[coordinates[0] - self.coordinates_min[0]][coordinates[1] - self.coordinates_min[1]][
-            coordinates[2] - self.coordinates_min[2]]
+        key = ((coordinates[0] >> 4) // SLICE_CACHE_CHUNKS, (coordinates[2] >> 4) // SLICE_CACHE_CHUNKS)
+        if key not in self.slices:
+            size = SLICE_CACHE_CHUNKS * 16
+            self.slices[key] = self.editor.loadWorldSlice(Rect((key[0] * size, key[1] * size), (size, size)))
+
+        blockStateTag = self.slices[key].getBlockStateTagGlobal(ivec3(*coordinates))
+        if blockStateTag is None:
+            return "minecraft:void_air"
+        return str(blockStateTag["Name"])
 
     def getNeighbors(self, Block):
         for i in range(-1, 2):
@@ -98,7 +218,7 @@ class World:
         Scan the world with no optimization. Not tested on large areas.
         """
 
-        editor = Editor(buffering=True)
+        editor = self.editor
 
         for x in range(self.coordinates_min[0], self.coordinates_max[0] + 1):
             for y in range(self.coordinates_min[1], self.coordinates_max[1] + 1):
@@ -110,8 +230,8 @@ class World:
         Generate all needed datas for the generator : heightmap, watermap, and preset the volume with data from the heightmap.
         """
 
-        editor = Editor()
-        buildArea = editor.getBuildArea()
+        editor = self.editor
+        buildArea = self.session.build_area
         buildRect = buildArea.toRect()
 
         xzStart = buildRect.begin
@@ -170,32 +290,92 @@ class World:
 
         return heightmap, watermap, treesmap
 
-    def propagate(self, coordinates, scanned=[]):
-        i = 0
-        editor = Editor(buffering=True)
-        if self.isInVolume(coordinates):
-            Block = self.getBlockFromCoordinates(coordinates)
+    def scanSurface(self, presetVolume: bool = True) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Bulk version of getData : decode the surface of the whole build area at once with arrays.
+
+        Args:
+            presetVolume (bool): also preset the volume with the surface blocks, like getData does.
+
+        Returns:
+            heightmap, watermap, treesmap: uint8 arrays indexed [z][x], same values as the getData images.
+        """
+
+        editor = self.editor
+        buildArea = self.session.build_area
+        buildRect = buildArea.toRect()
+
+        xzStart = buildRect.begin
+        print("[World]", '('+str(xzStart[0])+', '+str(xzStart[1])+')',  "xzStart")
+
+        slice = editor.loadWorldSlice(buildRect)
+
+        heightmapData = np.array(slice.heightmaps["MOTION_BLOCKING_NO_LEAVES"], dtype=np.uint8).astype(np.int64) - 1
+        treesmapData = np.array(slice.heightmaps["MOTION_BLOCKING"], dtype=np.uint8).astype(np.int64) - 1
+
+        names = {}
+        sections = {}
+        blocks, biomes = sliceSurface(slice, heightmapData, names, sections)
+        maybeATree, _ = sliceSurface(slice, treesmapData, names, sections)
+
+        treeIds = [id for name, id in names.items() if name in lookup.TREES]
+        waterBlockIds = [id for name, id in names.items() if name in waterBlocks]
+        waterBiomeIds = [id for name, id in names.items() if name in waterBiomes]
+
+        isTree = np.isin(maybeATree, treeIds)
+        isTreeSurface = np.isin(blocks, treeIds)
+        isWater = np.isin(biomes, waterBiomeIds) | np.isin(blocks, waterBlockIds)
+
+        # Replace the height of the columns where the surface is a tree by the average of the non tree neighbors.
+        ground = ~isTreeSurface
+        height = ndimage.convolve(np.where(ground, heightmapData, 0), NEIGHBORS_KERNEL, mode='constant', cval=0)
+        number = ndimage.convolve(ground.astype(np.int64), NEIGHBORS_KERNEL, mode='constant', cval=0)
+        average = np.round(height / np.maximum(number, 1)).astype(np.int64)
+        heightmap = np.where(ground, heightmapData, np.where(number != 0, average, 0))
+
+        treesmap = np.where(isTree, treesmapData, 0)
+        watermap = np.where(isWater, 255, 0)
+
+        if presetVolume:
+            x, z = np.indices(blocks.shape)
+            coordinates = np.stack((x.ravel() + xzStart[0], np.full(x.size, 100), z.ravel() + xzStart[1]), axis=1)  # y set to 100 for 2D
+            inside = np.all((coordinates >= self.coordinates_min) & (coordinates <= self.coordinates_max), axis=1)
+            self.volume.set_many(coordinates[inside] - self.coordinates_min, blocks.ravel()[inside], list(names))
+
+        return (heightmap.T.astype(np.uint8), watermap.T.astype(np.uint8), treesmap.T.astype(np.uint8))
+
+    def propagate(self, coordinates, scanned=None) -> set:
+        """
+        Flood fill the surface from a block, with an iterative breadth first search.
+
+        Args:
+            coordinates (tuple): coordinates of the starting block.
+            scanned (set): coordinates already visited, updated in place.
+
+        Returns:
+            set: coordinates of every block visited.
+        """
+
+        if scanned is None:
+            scanned = set()
+        if not self.isInVolume(coordinates):
+            return scanned
+
+        queue = deque([tuple(coordinates)])
+        while queue:
+            Block = self.getBlockFromCoordinates(queue.popleft())
             self.getNeighbors(Block)
             for neighbor in Block.neighbors:
-                if neighbor not in scanned:
-                    scanned.append(neighbor)
+                if neighbor.coordinates not in scanned:
+                    scanned.add(neighbor.coordinates)
                     self.getNeighbors(neighbor)
                     if neighbor.isSurface():
-                        self.propagate(neighbor.coordinates, scanned)
+                        queue.append(neighbor.coordinates)
+
+        return scanned
 
     def volumeTo3DBinaryImage(self):
-        binaryImage = []
-        for x in range(self.length_x):
-            binaryImage.append([])
-            for y in range(self.length_y):
-                binaryImage[x].append([])
-                for z in range(self.length_z):
-                    if self.volume[x][y][z] != None:
-                        binaryImage[x][y].append(True)
-                    else:
-                        binaryImage[x][y].append(False)
-
-        return np.array(binaryImage)
+        return self.volume.to_binary_image()
 
     def maskVolume(self, mask):
         """
@@ -205,15 +385,15 @@ class World:
         Args:
             mask (image): white or black image : combined watermap smoothed and sobel smoothed.
         """
-        editor = Editor()
-        buildArea = editor.getBuildArea()
+        editor = self.editor
+        buildArea = self.session.build_area
         buildRect = buildArea.toRect()
 
         xzStart = buildRect.begin
         xzDistance = (max(buildRect.end[0], buildRect.begin[0]) - min(buildRect.end[0], buildRect.begin[0]),
                       max(buildRect.end[1], buildRect.begin[1]) - min(buildRect.end[1], buildRect.begin[1]))
 
-        mask = Image.open(mask)
+        mask = maps.open(mask) if isinstance(mask, str) else mask
 
         slice = editor.loadWorldSlice(buildRect)
 
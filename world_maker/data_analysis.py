@@ -4,16 +4,20 @@ import numpy as np
 from scipy import ndimage
 from world_maker.Skeleton import Skeleton
 from world_maker.Position import Position
+from world_maker.MapRegistry import maps
 from random import randint, choice
 import cv2
 
 
-def get_data(world: World):
+def get_data(world: World, bulk: bool = True):
     print("[Data Analysis] Generating data...")
-    heightmap, watermap, treemap = world.getData()
-    heightmap.save('./world_maker/data/heightmap.png')
-    watermap.save('./world_maker/data/watermap.png')
-    treemap.save('./world_maker/data/treemap.png')
+    if bulk:
+        heightmap, watermap, treemap = (Image.fromarray(array) for array in world.scanSurface())
+    else:
+        heightmap, watermap, treemap = world.getData()
+    maps.set('./world_maker/data/heightmap.png', heightmap)
+    maps.set('./world_maker/data/watermap.png', watermap)
+    maps.set('./world_maker/data/treemap.png', treemap)
     print("[Data Analysis] Data generated.")
     return heightmap, watermap, treemap
 
@@ -29,12 +33,32 @@ def get_data_no_update():
     return heightmap, watermap, treemap
 
 
-def handle_import_image(image: str | Image.Image) -> Image.Image:
+def handle_import_image(image: str | Image.Image | np.ndarray) -> Image.Image:
     if isinstance(image, str):
-        return Image.open(image)
+        return maps.open(image)
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
     return image
 
 
+def handle_import_array(image: str | Image.Image | np.ndarray) -> np.ndarray:
+    """
+    Get a map as a grayscale array, without converting it if it's already an array.
+
+    Args:
+        image (image): path, image or array of the map
+    """
+    if isinstance(image, str):
+        image = handle_import_image(image)
+    if isinstance(image, np.ndarray):
+        if image.dtype == bool:
+            return image.astype(np.uint8) * 255
+        if image.ndim == 2:
+            return image
+        image = Image.fromarray(image)
+    return np.array(image.convert('L'))
+
+
 def filter_negative(image: str | Image.Image) -> Image.Image:
     """
     Invert the colors of an image.
@@ -116,6 +140,47 @@ def filter_sobel(image: str | Image.Image) -> Image.Image:
     return image
 
 
+def filter_sobel_optimized(image: str | Image.Image) -> Image.Image:
+    """
+    Edge detection algorithms from an image, computed with shifted slices instead of a loop per pixel.
+    Same output as filter_sobel.
+
+    Args:
+        image (image): image to filter
+    """
+
+    # Open the image
+    image = handle_import_image(image).convert('RGB')
+
+    img = np.array(image).astype(np.uint8)
+
+    # Apply gray scale
+    gray_img = np.round(
+        0.299 * img[:, :, 0] + 0.587 * img[:, :, 1] + 0.114 * img[:, :, 2]
+    ).astype(np.int64)
+
+    h, w = gray_img.shape
+    newgradientImage = np.zeros((h, w))
+
+    # Neighbors of every pixel not on the border
+    top, middle, bottom = gray_img[:-2], gray_img[1:-1], gray_img[2:]
+    left, center, right = slice(None, -2), slice(1, -1), slice(2, None)
+
+    horizontalGrad = ((top[:, right] + 2 * middle[:, right] + bottom[:, right])
+                      - (top[:, left] + 2 * middle[:, left] + bottom[:, left]))
+    verticalGrad = ((bottom[:, left] + 2 * bottom[:, center] + bottom[:, right])
+                    - (top[:, left] + 2 * top[:, center] + top[:, right]))
+
+    # Edge Magnitude, offset by 1 like filter_sobel
+    newgradientImage[:h - 2, :w - 2] = np.sqrt(
+        np.power(horizontalGrad, 2.0) + np.power(verticalGrad, 2.0))
+
+    image = Image.fromarray(newgradientImage)
+    image = image.convert("L")
+
+    return image
+
+
 def filter_smooth_theshold(image: str | Image.Image, radius: int = 3):
     """
     :param image: white and black image representing the derivative of the terrain (sobel), where black is flat and white is very steep.
@@ -153,54 +218,62 @@ def filter_smooth(image: str | Image.Image, radius: int = 3):
     return image
 
 
-def subtract_map(image: str | Image.Image, substractImage: str | Image.Image) -> Image.Image:
-    image = handle_import_image(image)
-    substractImage = handle_import_image(substractImage).convert('L')
+def subtract_array(array: str | Image.Image | np.ndarray, substractArray: str | Image.Image | np.ndarray) -> np.ndarray:
+    """
+    Set to 0 every pixel of a map that is white (255) in the other one.
 
-    array_heightmap = np.array(image)
-    array_substractImage = np.array(substractImage)
+    Args:
+        array (image): map to subtract from, kept in its own mode
+        substractArray (image): grayscale mask of the pixels to remove
+    """
+    if isinstance(array, np.ndarray):
+        array = array.copy()
+    else:
+        array = np.array(handle_import_image(array))
+    mask = handle_import_array(substractArray) == 255
+    array[mask] = 0
+    return array
 
-    mask = array_substractImage == 255
-    array_heightmap[mask] = 0
 
-    return Image.fromarray(array_heightmap)
+def subtract_map(image: str | Image.Image, substractImage: str | Image.Image) -> Image.Image:
+    return Image.fromarray(subtract_array(image, substractImage))
 
 
-def overide_map(base: Image, top: Image) -> Image.Image:
-    base = handle_import_image(base).convert('L')
-    top = handle_import_image(top).convert('L')
+def overide_array(base: str | Image.Image | np.ndarray, top: str | Image.Image | np.ndarray) -> np.ndarray:
+    """
+    Put the non black pixels of the top map over the base map.
 
-    width, height = base.size
+    Args:
+        base (image): grayscale map under
+        top (image): grayscale map over
+    """
+    base = handle_import_array(base)
+    top = handle_import_array(top)
 
-    if top.size != (width, height):
+    if top.shape != base.shape:
         raise ValueError("Mismatching images sizes")
 
-    result_image = Image.new('L', (width, height))
+    return np.where(top != 0, top, base)
 
-    for x in range(width):
-        for y in range(height):
-            base_pixel = base.getpixel((x, y))
-            top_pixel = top.getpixel((x, y))
 
-            if top_pixel != 0:
-                result_image.putpixel((x, y), top_pixel)
-            else:
-                result_image.putpixel((x, y), base_pixel)
-
-    return result_image
+def overide_map(base: Image, top: Image) -> Image.Image:
+    return Image.fromarray(overide_array(base, top))
 
 
-def group_map(image1: str | Image.Image, image2: str | Image.Image) -> Image.Image:
-    image1 = handle_import_image(image1).convert('L')
-    image2 = handle_import_image(image2).convert('L')
+def group_array(array1: str | Image.Image | np.ndarray, array2: str | Image.Image | np.ndarray) -> np.ndarray:
+    """
+    Add the white (255) pixels of the first map to the second one.
 
-    array1 = np.array(image1)
-    array2 = np.array(image2)
+    Args:
+        array1 (image): grayscale map added
+        array2 (image): grayscale map to add to
+    """
+    mask = handle_import_array(array1) == 255
+    return np.where(mask, 255, handle_import_array(array2)).astype(np.uint8)
 
-    mask = array1 == 255
-    array2[mask] = 255
 
-    return Image.fromarray(array2)
+def group_map(image1: str | Image.Image, image2: str | Image.Image) -> Image.Image:
+    return Image.fromarray(group_array(image1, image2))
 
 
 def filter_smooth_array(array: np.ndarray, radius: int = 3) -> np.ndarray:
@@ -265,7 +338,7 @@ def highway_map() -> Image.Image:
     array_sobel_water = np.array(array_sobel_water)
 
     image = Image.fromarray(array_sobel_water)
-    image.save('./world_maker/data/smooth_for_highway.png')
+    maps.set('./world_maker/data/smooth_for_highway.png', image)
 
     # Remove details
     # image_no_details = filter_remove_details(image, 10)
@@ -288,7 +361,7 @@ def create_volume(surface: np.ndarray, heightmap: np.ndarray, make_it_flat: bool
 
 def convert_2D_to_3D(image: str | Image.Image, make_it_flat: bool = False) -> np.ndarray:
     image = handle_import_image(image)
-    heightmap = Image.open(
+    heightmap = handle_import_image(
         './world_maker/data/heightmap_smooth.png').convert('L')
     heightmap = np.array(heightmap)
     surface = np.array(image)
@@ -299,9 +372,9 @@ def convert_2D_to_3D(image: str | Image.Image, make_it_flat: bool = False) -> np
 def skeleton_highway_map(image: str | Image.Image = './world_maker/data/highwaymap.png') -> Skeleton:
     image_array = convert_2D_to_3D(image, True)
     skeleton = Skeleton(image_array)
-    skeleton.parse_graph(True)
+    skeleton.parse_branches(True)
     heightmap_skeleton = skeleton.map()
-    heightmap_skeleton.save('./world_maker/data/skeleton_highway.png')
+    maps.set('./world_maker/data/skeleton_highway.png', heightmap_skeleton)
     skeleton.road_area('skeleton_highway_area.png', 10)
     return skeleton
 
@@ -309,9 +382,9 @@ def skeleton_highway_map(image: str | Image.Image = './world_maker/data/highwaym
 def skeleton_mountain_map(image: str | Image.Image = './world_maker/data/mountain_map.png') -> Skeleton:
     image_array = convert_2D_to_3D(image, True)
     skeleton = Skeleton(image_array)
-    skeleton.parse_graph()
+    skeleton.parse_branches()
     heightmap_skeleton = skeleton.map()
-    heightmap_skeleton.save('./world_maker/data/skeleton_mountain.png')
+    maps.set('./world_maker/data/skeleton_mountain.png', heightmap_skeleton)
     skeleton.road_area('skeleton_mountain_area.png', 3)
     return skeleton
 
@@ -327,131 +400,111 @@ def smooth_sobel_water(image: str | Image.Image = "./world_maker/data/sobelmap.p
     sobel = filter_negative(Image.fromarray(sobel_array))
     group = group_map(watermap, sobel)
     group = filter_negative(group)
-    group.save('./world_maker/data/smooth_sobel_watermap.png')
+    maps.set('./world_maker/data/smooth_sobel_watermap.png', group)
     return group
 
 
-def mountain_map_expend(mountain_map: list[list[int]], starting_point: tuple[int, int], value: int):
-    explore_points = [starting_point]
-    while len(explore_points) > 0:
-        x, y = explore_points.pop(0)
-        mountain_map[y][x] = value
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if (0 <= x + i < len(mountain_map[0]) and 0 <= y + j < len(mountain_map) and
-                        mountain_map[y + j][x + i] == 0):
-                    if (x + i, y + j) not in explore_points:
-                        explore_points.append((x + i, y + j))
-
-
-def set_values_of_building_mountain(mountain_map: list[list[int]], area_mountain: list[int],
-                                    building_map: str | Image.Image = "./world_maker/data/smooth_sobel_watermap.png"):
-    building_map = handle_import_image(building_map).convert('L')
-    for y in range(building_map.size[1]):
-        for x in range(building_map.size[0]):
-            if building_map.getpixel((x, y)) > 144:
-                if mountain_map[y][x] != -1:
-                    area_mountain[mountain_map[y][x] - 1] += 1
-
-
-def get_index_of_biggest_area_mountain(area_mountain: list[int], exception: list[int]) -> int:
-    max_value = -1
-    index = -1
-    for i in range(len(area_mountain)):
-        if i not in exception and area_mountain[i] > max_value:
-            max_value = area_mountain[i]
-            index = i
-    return index
-
-
-def get_random_point_in_area_mountain(mountain_map: list[list[int]], index: int) -> Position | None:
-    points = []
-    for y in range(len(mountain_map)):
-        for x in range(len(mountain_map[0])):
-            if mountain_map[y][x] == index + 1:
-                points.append(Position(x, y))
-    if not points:
+def label_mountain(image_heightmap: np.ndarray, height_threshold: int) -> tuple[np.ndarray, int]:
+    """
+    Label the connected areas (8-connectivity) higher than the average height plus a threshold.
+
+    Args:
+        image_heightmap (np.ndarray): grayscale heightmap
+        height_threshold (int): minimum height above the average
+
+    Returns:
+        mountain_map, number: labels of the areas starting from 1 (0 outside of any area), number of areas
+    """
+    avg_height = int(np.sum(image_heightmap, dtype=np.int64) / image_heightmap.size)
+    print("[Data Analysis] Average height:", avg_height)
+
+    mountain_map, number = ndimage.label(image_heightmap >= (avg_height + height_threshold),
+                                         structure=np.ones((3, 3), dtype=int))
+    return mountain_map, number
+
+
+def set_values_of_building_mountain(mountain_map: np.ndarray, number: int,
+                                    building_map: str | Image.Image = "./world_maker/data/smooth_sobel_watermap.png") \
+        -> np.ndarray:
+    """
+    Get the buildable area of each mountain.
+    """
+    building_map = handle_import_array(building_map) > 144
+    return ndimage.sum(building_map, mountain_map, index=np.arange(1, number + 1))
+
+
+def get_random_point_in_area_mountain(mountain_map: np.ndarray, index: int) -> Position | None:
+    y, x = np.nonzero(mountain_map == index + 1)
+    if len(x) == 0:
         return None
-    return choice(points)
+    point = choice(range(len(x)))
+    return Position(int(x[point]), int(y[point]))
 
 
-def get_center_of_area_mountain(mountain_map: list[list[int]], index: int) -> Position:
-    sum_x = 0
-    sum_y = 0
-    count = 0
-    for y in range(len(mountain_map)):
-        for x in range(len(mountain_map[0])):
-            if mountain_map[y][x] == index + 1:
-                sum_x += x
-                sum_y += y
-                count += 1
-    center = Position(sum_x // count, sum_y // count)
-    if mountain_map[center.y][center.x] != index + 1:
-        return get_random_point_in_area_mountain(mountain_map, index)
-    return center
+def get_center_of_area_mountain(mountain_map: np.ndarray, number: int, indices: list[int]) -> list[Position]:
+    """
+    Get the center of some mountains, or a random point of the mountain if the center is outside of it.
+    """
+    y, x = np.indices(mountain_map.shape)
+    labels = np.arange(1, number + 1)
+    count = ndimage.sum(np.ones(mountain_map.shape, dtype=np.int64), mountain_map, index=labels).astype(np.int64)
+    sum_x = ndimage.sum(x, mountain_map, index=labels).astype(np.int64)
+    sum_y = ndimage.sum(y, mountain_map, index=labels).astype(np.int64)
+
+    centers = []
+    for index in indices:
+        center = Position(int(sum_x[index] // count[index]), int(sum_y[index] // count[index]))
+        if mountain_map[center.y][center.x] != index + 1:
+            center = get_random_point_in_area_mountain(mountain_map, index)
+        centers.append(center)
+    return centers
 
 
 def detect_mountain(number_of_mountain: int = 2, height_threshold: int = 10,
                     image_heightmap: str | Image.Image = './world_maker/data/heightmap.png') -> list[Position]:
     print("[Data Analysis] Detecting mountains...")
-    image_heightmap = handle_import_image(image_heightmap).convert('L')
-
-    avg_height = 0
-    for y in range(image_heightmap.size[1]):
-        for x in range(image_heightmap.size[0]):
-            avg_height += image_heightmap.getpixel((x, y))
-    avg_height = int(
-        avg_height / (image_heightmap.size[0] * image_heightmap.size[1]))
-    print("[Data Analysis] Average height:", avg_height)
-
-    mountain_map = [[-1 if image_heightmap.getpixel((x, y)) < (avg_height + height_threshold) else 0 for x in
-                     range(image_heightmap.size[0])] for y in
-                    range(image_heightmap.size[1])]
+    image_heightmap = handle_import_array(image_heightmap)
 
-    area_mountain = []
-    for y in range(image_heightmap.size[1]):
-        for x in range(image_heightmap.size[0]):
-            if mountain_map[y][x] == 0:
-                area_mountain.append(0)
-                mountain_map_expend(mountain_map, (x, y), len(area_mountain))
+    mountain_map, number = label_mountain(image_heightmap, height_threshold)
 
-    if not area_mountain:
+    if number == 0:
         print("[Data Analysis] No mountain detected.")
         return []
 
-    set_values_of_building_mountain(mountain_map, area_mountain)
-    if number_of_mountain < len(area_mountain):
-        index_mountain = []
-        for n in range(number_of_mountain):
-            index_mountain.append(get_index_of_biggest_area_mountain(
-                area_mountain, index_mountain))
+    area_mountain = set_values_of_building_mountain(mountain_map, number)
+    if number_of_mountain < number:
+        # Biggest areas first, the first mountain found wins ties.
+        index_mountain = [int(i) for i in np.argsort(-area_mountain, kind='stable')[:number_of_mountain]]
     else:
-        index_mountain = [i for i in range(len(area_mountain))]
+        index_mountain = [i for i in range(number)]
 
-    position_mountain = []
-    for i in range(len(index_mountain)):
-        position_mountain.append(get_center_of_area_mountain(
-            mountain_map, index_mountain[i]))
+    return get_center_of_area_mountain(mountain_map, number, index_mountain)
 
-    return position_mountain
+
+def most_common_height(heights: np.ndarray) -> int:
+    """
+    Get the most common value of an area of a heightmap. On ties, the value met first going through the area
+    x first then y is kept.
+
+    Args:
+        heights (np.ndarray): area of the heightmap, indexed [y][x]
+    """
+    heights = heights.T.ravel()
+    count = np.bincount(heights)
+    candidates = np.flatnonzero(count == count.max())
+    if len(candidates) == 1:
+        return int(candidates[0])
+    return int(heights[np.argmax(np.isin(heights, candidates))])
 
 
 def rectangle_2D_to_3D(rectangle: list[tuple[tuple[int, int], tuple[int, int]]],
                        height_min: int = 6, height_max: int = 10) \
         -> list[tuple[tuple[int, int, int], tuple[int, int, int]]]:
-    image = handle_import_image(
-        './world_maker/data/heightmap.png').convert('L')
+    heightmap = handle_import_array('./world_maker/data/heightmap.png')
     new_rectangle = []
     for rect in rectangle:
         start, end = rect
-        height = {}
-        for x in range(start[0], end[0]):
-            for y in range(start[1], end[1]):
-                if image.getpixel((x, y)) not in height:
-                    height[image.getpixel((x, y))] = 1
-                else:
-                    height[image.getpixel((x, y))] += 1
-        max_height = max(height, key=height.get)
+        max_height = most_common_height(heightmap[start[1]:end[1], start[0]:end[0]])
         new_rectangle.append(
             ((start[0], max_height, start[1]), (end[0], max_height + randint(height_min, height_max), end[1])))
     return new_rectangle
@@ -465,3 +518,22 @@ def transpose_form_heightmap(heightmap: str | Image.Image, coordinates, origin:
 
     return (coordinates[0] + xMin, heightmap.getpixel(
         (coordinates[0], coordinates[-1])), coordinates[-1] + zMin)
+
+
+def transpose_form_heightmap_array(heightmap: str | Image.Image | np.ndarray, coordinates,
+                                   origin: tuple[int, int]) -> np.ndarray:
+    """
+    Batch version of transpose_form_heightmap: project many map coordinates to world coordinates at once.
+
+    Args:
+        heightmap (image): path, image or array of the heightmap, pass an array to load it only once
+        coordinates (np.ndarray): N x 2 or N x 3 map coordinates, the first column is x and the last one is z
+        origin (tuple): world x and z of the first pixel of the map
+
+    Returns:
+        np.ndarray: N x 3 world coordinates, the height is read in the heightmap
+    """
+    heightmap = handle_import_array(heightmap)
+    coordinates = np.asarray(coordinates).reshape(len(coordinates), -1).astype(np.int64)
+    x, z = coordinates[:, 0], coordinates[:, -1]
+    return np.column_stack((x + origin[0], heightmap[z, x], z + origin[1]))
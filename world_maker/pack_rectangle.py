@@ -1,8 +1,12 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 import numpy as np
 from typing import Union
-from world_maker.data_analysis import handle_import_image
-from random import randint
+from world_maker.data_analysis import handle_import_image, handle_import_array
+from world_maker.MapRegistry import maps
+from random import randint, Random
 
 
 class Rectangle:
@@ -57,16 +61,84 @@ class Bin:
                 self.grid[rect_y][rect_x] = False
 
 
-def generate_rectangle(min_width: int = 10, max_width: int = 25):
-    width = randint(min_width, max_width)
-    height = randint(min_width, max_width)
+def summed_area_table(grid) -> np.ndarray:
+    """
+    Integral image of the free cells of the grid, with a row and a column of 0 before the first ones.
+    table[y][x] is the number of free cells in grid[:y, :x].
+    """
+    grid = np.asarray(grid)
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(grid != 0, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+class SummedAreaBin:
+    """
+    Same packing as Bin, but the free cells are counted with a summed-area table : checking if a window is free is
+    O(1), and all the windows are checked at once with array operations. The grid itself is never modified.
+
+    Attributes:
+        grid (np.ndarray): The grid of free (non zero) cells.
+        table (np.ndarray): The summed-area table of the free cells, updated after each placement.
+        rectangles (list): The placed rectangles.
+    """
+
+    def __init__(self, grid, table: np.ndarray = None):
+        """
+        :param grid: The grid of free (non zero) cells.
+        :param table: The summed-area table of the grid, to avoid computing it again between tries. It is copied.
+        """
+        self.grid = grid
+        self.table = summed_area_table(grid) if table is None else table.copy()
+        self.rectangles = []
+
+    def free_area(self, x, y, width, height) -> int:
+        return int(self.table[y + height, x + width] - self.table[y, x + width]
+                   - self.table[y + height, x] + self.table[y, x])
+
+    def can_place(self, rectangle, x, y):
+        return self.free_area(x, y, rectangle.width, rectangle.height) == rectangle.width * rectangle.height
+
+    def place_rectangle(self, rectangle):
+        width, height = rectangle.width, rectangle.height
+        if height > self.table.shape[0] - 1 or width > self.table.shape[1] - 1:
+            return False
+
+        table = self.table
+        free = (table[height:, width:] - table[:-height, width:] - table[height:, :-width]
+                + table[:-height, :-width]) == width * height
+
+        # Every free spot has the same empty area, Bin keeps the first one found, x first then y.
+        free = free.T
+        if not free.any():
+            return False
+        i, j = (int(k) for k in np.unravel_index(np.argmax(free), free.shape))
+
+        self.rectangles.append(((i, j), (i + width, j + height)))
+        self.update_grid(rectangle, i, j)
+        return True
+
+    def update_grid(self, rectangle, x, y):
+        # All the cells of the rectangle were free : each following entry loses the cells of the rectangle before it.
+        rows = np.minimum(np.arange(1, self.table.shape[0] - y), rectangle.height)
+        cols = np.minimum(np.arange(1, self.table.shape[1] - x), rectangle.width)
+        self.table[y + 1:, x + 1:] -= rows[:, None] * cols[None, :]
+
+
+def generate_rectangle(min_width: int = 10, max_width: int = 25, rng: Random = None):
+    if rng is None:
+        width = randint(min_width, max_width)
+        height = randint(min_width, max_width)
+    else:
+        width = rng.randint(min_width, max_width)
+        height = rng.randint(min_width, max_width)
     return Rectangle(width, height)
 
 
-def pack_rectangles(grid, min_width: int = 10, max_width: int = 25):
-    bin = Bin(grid)
+def pack_rectangles(grid, min_width: int = 10, max_width: int = 25, table: np.ndarray = None, rng: Random = None):
+    bin = SummedAreaBin(grid, table)
     while True:
-        rectangle = generate_rectangle(min_width, max_width)
+        rectangle = generate_rectangle(min_width, max_width, rng)
         print(f"[Pack rectangles] Number of rectangles: {len(bin.rectangles)}")
         if not bin.place_rectangle(rectangle) or len(bin.rectangles) >= 3000:
             break
@@ -74,19 +146,14 @@ def pack_rectangles(grid, min_width: int = 10, max_width: int = 25):
 
 
 def draw_rectangles(rectangles, grid, heightmap):
-    heightmap = handle_import_image(heightmap).convert('L')
-    image = Image.new('L', (len(grid[0]), len(grid)), 0)
+    heightmap = handle_import_array(heightmap)
+    array = np.zeros((len(grid), len(grid[0])), dtype=np.uint8)
     for rectangle in rectangles:
         start, end = rectangle
-        height = []
-        for x in range(start[0], end[0]):
-            for y in range(start[1], end[1]):
-                height.append(heightmap.getpixel((x, y)))
-        height_average = sum(height)/len(height)
-        for x in range(start[0], end[0]):
-            for y in range(start[1], end[1]):
-                image.putpixel((x, y), round(height_average))
-    return image
+        height = heightmap[start[1]:end[1], start[0]:end[0]]
+        height_average = int(np.sum(height, dtype=np.int64)) / height.size
+        array[start[1]:end[1], start[0]:end[0]] = round(height_average)
+    return Image.fromarray(array)
 
 
 def area_of_rectangles(rectangles):
@@ -97,18 +164,61 @@ def area_of_rectangles(rectangles):
     return area
 
 
+def pack_rectangles_try(grid_path: str, table_path: str, min_width: int, max_width: int, seed: int):
+    """
+    One try of generate_building, run in a worker process. The grid and its table are memory-mapped read only.
+    """
+    grid = np.load(grid_path, mmap_mode='r')
+    table = np.load(table_path, mmap_mode='r')
+    return pack_rectangles(grid, min_width, max_width, table, Random(seed))
+
+
 def generate_building(image: str | Image.Image, heightmap: str | Image.Image, output: str = './world_maker/data/building.png',
-                      number_of_try: int = 1, min_width: int = 10, max_width: int = 25):
+                      number_of_try: int = 1, min_width: int = 10, max_width: int = 25, seed: int = None,
+                      workers: int = None) -> tuple[list, int]:
+    """
+    Place building rectangles on the free area of a map. Several tries are run in parallel, the one covering the
+    largest area is kept.
+
+    Args:
+        image (image): map of the free area (non zero pixels)
+        heightmap (image): heightmap used to draw the output map
+        output (str): name or path of the output map in the map registry
+        number_of_try (int): number of packings to try
+        seed (int): seed of the first try, the next tries use the following seeds. Random by default.
+        workers (int): number of processes, the number of CPUs by default
+
+    Returns:
+        rectangles, seed: the best rectangles, and the seed giving them again with number_of_try=1
+    """
     print("[Building] Start generating building position...")
     image = handle_import_image(image).convert('L')
+    grid = np.array(image)
+    table = summed_area_table(grid)
+    if seed is None:
+        seed = randint(0, 2 ** 31 - 1)
+    seeds = [seed + n for n in range(number_of_try)]
+
+    if number_of_try == 1:
+        results = [pack_rectangles(grid, min_width, max_width, table, Random(seed))]
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            grid_path, table_path = os.path.join(directory, 'grid.npy'), os.path.join(directory, 'table.npy')
+            np.save(grid_path, grid)
+            np.save(table_path, table)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(pack_rectangles_try, [grid_path] * number_of_try,
+                                            [table_path] * number_of_try, [min_width] * number_of_try,
+                                            [max_width] * number_of_try, seeds))
+
     rectangles_output = []
-    for n in range(number_of_try):
-        print("[Building] Try", n+1)
-        grid = np.array(image)
-        rectangles = pack_rectangles(grid, min_width, max_width)
+    seed_output = seed
+    for n, rectangles in enumerate(results):
+        print("[Building] Try", n+1, "seed", seeds[n])
         print("[Building] Number of building:", len(rectangles))
         print("[Building] Area of building:", area_of_rectangles(rectangles))
         if area_of_rectangles(rectangles) > area_of_rectangles(rectangles_output):
             rectangles_output = rectangles
-    draw_rectangles(rectangles_output, grid, heightmap).save(output)
-    return rectangles_output
+            seed_output = seeds[n]
+    maps.set(output, draw_rectangles(rectangles_output, grid, heightmap))
+    return rectangles_output, seed_output
@@ -3,15 +3,109 @@ from typing import Union
 import numpy as np
 from gdpc import Editor, Block, geometry, lookup
 from PIL import Image
+from scipy import ndimage
 from skimage import morphology
 
 from world_maker.data_analysis import handle_import_image
+from world_maker.MapRegistry import maps
+from world_maker.World import sliceSurface
+from utils.EditorSession import EditorSession, get_session
 
+# Maximum number of blocks of a fill command.
+FILL_LIMIT = 32768
 
-def remove_trees(heightmap: Union[str, Image.Image], treesmap: Union[str, Image.Image], mask: Union[str, Image.Image]):
+
+def select_trees(treesmap: np.ndarray, mask: np.ndarray, tolerance: int = 1) -> np.ndarray:
+    """
+    Select the trees under the mask: same pixels as flooding the treesmap (8-connectivity, values within tolerance
+    of the seed) from every tree pixel of the mask. The trees are labelled once to find the ones touching the mask,
+    then each seed height is flooded at once with a labelling inside the bounding box of its trees.
+
+    :param treesmap: The height of the trees, 0 without tree, indexed [z][x].
+    :param mask: The pixels where the trees are removed.
+    :param tolerance: The maximum height difference with the seed in a tree.
+    :return: The boolean map of the selected trees.
+    """
+    treesmap = treesmap.astype(np.int16)
+    seeds = mask & (treesmap > 0)
+    structure = np.ones((3, 3), dtype=bool)
+    labels, _ = ndimage.label(treesmap > 0, structure)
+    boxes = ndimage.find_objects(labels)
+
+    removed = np.zeros(treesmap.shape, dtype=bool)
+    seeds_z, seeds_x = np.nonzero(seeds)
+    seeds_value = treesmap[seeds_z, seeds_x]
+    for value in np.unique(seeds_value):
+        z, x = seeds_z[seeds_value == value], seeds_x[seeds_value == value]
+        if value - tolerance > 0:
+            # The flooded pixels are trees: only look at the trees of the seeds.
+            trees = np.unique(labels[z, x])
+            window = (slice(min(boxes[tree - 1][0].start for tree in trees),
+                            max(boxes[tree - 1][0].stop for tree in trees)),
+                      slice(min(boxes[tree - 1][1].start for tree in trees),
+                            max(boxes[tree - 1][1].stop for tree in trees)))
+        else:
+            window = (slice(0, treesmap.shape[0]), slice(0, treesmap.shape[1]))
+        band, _ = ndimage.label(np.abs(treesmap[window] - value) <= tolerance, structure)
+        removed[window] |= np.isin(band, band[z - window[0].start, x - window[1].start])
+    return removed
+
+
+def column_cuboids(mask: np.ndarray, bottom: np.ndarray, top: np.ndarray) -> list[tuple[int, int, int, int, int, int]]:
+    """
+    Group the columns of the mask into cuboids: runs of columns along x with the same bottom and top, merged along z
+    when the same run continues on the next row.
+
+    :param mask: The columns to group, indexed [z][x].
+    :param bottom: The lowest y of each column.
+    :param top: The highest y of each column.
+    :return: The cuboids (x_min, z_min, x_max, z_max, bottom, top), bounds included.
+    """
+    width = mask.shape[1]
+    pixels = np.flatnonzero(mask)
+    if len(pixels) == 0:
+        return []
+    bottoms, tops = bottom.ravel()[pixels], top.ravel()[pixels]
+    breaks = np.ones(len(pixels), dtype=bool)
+    breaks[1:] = ((pixels[1:] != pixels[:-1] + 1) | (pixels[1:] % width == 0)
+                  | (bottoms[1:] != bottoms[:-1]) | (tops[1:] != tops[:-1]))
+    starts = np.flatnonzero(breaks)
+    ends = np.r_[starts[1:], len(pixels)] - 1
+
+    cuboids = []
+    opened = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        z, x_min = divmod(int(pixels[start]), width)
+        key = (x_min, int(pixels[end]) % width, int(bottoms[start]), int(tops[start]))
+        if key in opened and opened[key][1] == z - 1:
+            opened[key][1] = z
+        else:
+            if key in opened:
+                cuboids.append((key[0], opened[key][0], key[1], opened[key][1], key[2], key[3]))
+            opened[key] = [z, z]
+    for key, (z_min, z_max) in opened.items():
+        cuboids.append((key[0], z_min, key[1], z_max, key[2], key[3]))
+    return cuboids
+
+
+def remove_trees(heightmap: Union[str, Image.Image], treesmap: Union[str, Image.Image], mask: Union[str, Image.Image],
+                 single_pass: bool = True, session: EditorSession = None):
+    """
+    Remove the trees touching the mask, with columns of air from the ground to the top of the world, or to the top
+    of the tree in single pass.
+
+    :param heightmap: The heightmap of the ground.
+    :param treesmap: The height of the trees, 0 without tree.
+    :param mask: The area where the trees are removed.
+    :param single_pass: Select all the trees at once with select_trees and fill the air as grouped cuboids with
+    fill_cuboids, instead of one flood and one line per pixel.
+    :param session: The session to place the blocks with, the default one if None. It is not flushed.
+    """
     print("[Remove tree] Starting...")
-    editor = Editor(buffering=True)
-    build_area = editor.getBuildArea()
+    if session is None:
+        session = get_session()
+    editor = session.editor
+    build_area = session.build_area
     build_rectangle = build_area.toRect()
 
     start = build_rectangle.begin
@@ -23,6 +117,20 @@ def remove_trees(heightmap: Union[str, Image.Image], treesmap: Union[str, Image.
     treesmap = handle_import_image(treesmap).convert('L')
     mask = handle_import_image(mask)
 
+    if single_pass:
+        area = (slice(0, distance[1]), slice(0, distance[0]))
+        removed = select_trees(np.array(treesmap)[area], np.array(mask.convert('L'))[area] != 0)
+        heights = np.array(heightmap, dtype=np.int64)[area]
+        # The columns of a tree go up to its highest block, instead of 255 as the legacy lines.
+        trees, count = ndimage.label(removed, np.ones((3, 3), dtype=bool))
+        tops = np.zeros(count + 1, dtype=np.int64)
+        tops[1:] = ndimage.maximum(np.array(treesmap, dtype=np.int64)[area], trees, np.arange(1, count + 1))
+        tops = tops[trees]
+        fill_cuboids(editor, column_cuboids(removed & (tops > heights), heights + 1, tops), Block('air'), start)
+        maps.set('./world_maker/data/removed_treesmap.png', Image.fromarray(removed))
+        print("[Remove tree] Done.")
+        return
+
     removed_treesmap = Image.new("L", distance, 0)
 
     removed = []
@@ -49,15 +157,50 @@ def remove_trees(heightmap: Union[str, Image.Image], treesmap: Union[str, Image.
                 geometry.placeLine(
                     editor, (start[0] + x, y+1, start[1] + z), (start[0] + x, y_top, start[1] + z), Block('air'))
 
-    removed_treesmap.save('./world_maker/data/removed_treesmap.png')
+    maps.set('./world_maker/data/removed_treesmap.png', removed_treesmap)
     print("[Remove tree] Done.")
 
 
-def smooth_terrain(heightmap: Union[str, Image.Image], heightmap_smooth: Union[str, Image.Image], mask: Union[str, Image.Image]):
+def fill_cuboids(editor: Editor, cuboids: list[tuple[int, int, int, int, int, int]], block: Block,
+                 origin: tuple[int, int]):
+    """
+    Fill cuboids of columns with one fill command each, split to stay under the fill limit of Minecraft. With a
+    buffering editor, the commands are sent together after the next flush of the blocks, in one request.
+
+    :param editor: The editor.
+    :param cuboids: The cuboids (x_min, z_min, x_max, z_max, y_from, y_to) of column_cuboids, in map coordinates.
+    :param block: The block to fill with.
+    :param origin: The world x and z of the first pixel of the map.
+    """
+    for x_min, z_min, x_max, z_max, y_from, y_to in cuboids:
+        y_min, y_max = min(y_from, y_to), max(y_from, y_to)
+        height = y_max - y_min + 1
+        x_step = max(1, min(x_max - x_min + 1, FILL_LIMIT // height))
+        z_step = max(1, FILL_LIMIT // (height * x_step))
+        for x in range(x_min, x_max + 1, x_step):
+            for z in range(z_min, z_max + 1, z_step):
+                editor.runCommandGlobal(
+                    f"fill {origin[0] + x} {y_min} {origin[1] + z} {origin[0] + min(x + x_step - 1, x_max)} {y_max} "
+                    f"{origin[1] + min(z + z_step - 1, z_max)} {block}", syncWithBuffer=True)
 
+
+def smooth_terrain(heightmap: Union[str, Image.Image], heightmap_smooth: Union[str, Image.Image], mask: Union[str, Image.Image],
+                   batched: bool = True, session: EditorSession = None):
+    """
+    Move the surface blocks of the mask from the heightmap to the smoothed heightmap.
+
+    :param heightmap: The heightmap of the ground.
+    :param heightmap_smooth: The smoothed heightmap.
+    :param mask: The area to smooth.
+    :param batched: Compute the changes with arrays, and place them as fill commands of grouped columns, instead of
+    one line per column.
+    :param session: The session to place the blocks with, the default one if None. It is not flushed.
+    """
     print("[Smooth terrain] Starting...")
-    editor = Editor(buffering=True)
-    build_area = editor.getBuildArea()
+    if session is None:
+        session = get_session()
+    editor = session.editor
+    build_area = session.build_area
     build_rectangle = build_area.toRect()
 
     start = build_rectangle.begin
@@ -69,11 +212,41 @@ def smooth_terrain(heightmap: Union[str, Image.Image], heightmap_smooth: Union[s
     heightmap_smooth = handle_import_image(heightmap_smooth).convert('L')
     mask = handle_import_image(mask).convert('L')
 
-    smooth_terrain_delta = Image.new("RGB", distance, 0)
-
     slice = editor.loadWorldSlice(build_rectangle)
     smoothable_blocks = lookup.OVERWORLD_SOILS | lookup.OVERWORLD_STONES | lookup.SNOWS
 
+    if batched:
+        area = np.s_[:distance[1], :distance[0]]
+        heights = np.array(heightmap, dtype=np.int64)[area]
+        heights_smooth = np.array(heightmap_smooth, dtype=np.int64)[area]
+        selected = np.array(mask)[area] != 0
+        delta = np.where(selected, heights - heights_smooth, 0)
+
+        # Same pixels as putpixel of the delta on a RGB image: the bytes of the delta as a 32 bits integer.
+        smooth_terrain_delta = np.zeros(delta.shape + (3,), dtype=np.uint8)
+        smooth_terrain_delta[selected] = delta[selected].astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3]
+
+        blocks = {}
+        block_ids, _ = sliceSurface(slice, heights.T, {}, {}, blocks)
+        block_ids = block_ids.T
+        smoothable = [index for index, block in blocks.items() if block.id in smoothable_blocks]
+        changed = (delta != 0) & np.isin(block_ids, smoothable)
+
+        # Lowered columns: air above the smoothed height, then the surface block on it. Raised columns: surface
+        # block up to the smoothed height.
+        fill_cuboids(editor, column_cuboids(changed & (delta > 0), heights_smooth + 1, heights), Block('air'), start)
+        for index in smoothable:
+            columns = changed & (block_ids == index)
+            lowered, raised = columns & (delta > 0), columns & (delta < 0)
+            fill_cuboids(editor, column_cuboids(lowered, heights_smooth, heights_smooth), blocks[index], start)
+            fill_cuboids(editor, column_cuboids(raised, heights, heights_smooth), blocks[index], start)
+
+        maps.set('./world_maker/data/smooth_terrain_delta.png', smooth_terrain_delta)
+        print("[Smooth terrain] Done.")
+        return
+
+    smooth_terrain_delta = Image.new("RGB", distance, 0)
+
     for x in range(0, distance[0]):
         for z in range(0, distance[1]):
 
@@ -96,5 +269,5 @@ def smooth_terrain(heightmap: Union[str, Image.Image], heightmap_smooth: Union[s
                             geometry.placeLine(
                                 editor, (start[0] + x, y, start[1] + z), (start[0] + x, y_smooth, start[1] + z), block)
 
-    smooth_terrain_delta.save('./world_maker/data/smooth_terrain_delta.png')
+    maps.set('./world_maker/data/smooth_terrain_delta.png', smooth_terrain_delta)
     print("[Smooth terrain] Done.")